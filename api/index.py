@@ -1,4 +1,5 @@
 import sys
+import asyncio
 from pathlib import Path
 
 # Add current directory to Python path for Backend modules
@@ -6,7 +7,16 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # Import the FastAPI app from main.py
 from main import app
+from database.postgres import init_db, warm_pool
 from mangum import Mangum
 
+# Run startup work once per container during the init phase instead of
+# driving the ASGI lifespan on every cold invocation. The loop is left set
+# as the current loop because Mangum calls asyncio.get_event_loop() per request.
+init_db()
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+loop.run_until_complete(warm_pool())
+
 # Wrap the FastAPI app with Mangum for Vercel serverless execution
-handler = Mangum(app)
+handler = Mangum(app, lifespan="off", api_gateway_base_path="/")
@@ -1,16 +1,20 @@
-import json
 import logging
-from pathlib import Path
+import threading
+from datetime import datetime
+from typing import Optional
 
-from .postgres import execute_query, execute_query_one, get_db_connection
+import orjson
+from cachetools import TTLCache
 
-logger = logging.getLogger(__name__)
+from .postgres import PoolExhaustedError, execute_query, execute_query_one
 
+logger = logging.getLogger(__name__)
 
-def init_db():
-    """Initialize the database - handled by postgres.py"""
-    # This is now handled in postgres.py
-    pass
+# Recommendation context per user; cleared whenever their outfits change.
+_USER_CTX_CACHE = TTLCache(maxsize=1024, ttl=60)
+_USER_CTX_LOCK = threading.RLock()
+# Rendered "other outfits" prompt snippet used by matching suggestions
+_MATCH_CTX_CACHE = TTLCache(maxsize=1024, ttl=300)
 
 
 def update_analysis_status(outfit_id: str, status: str, results: dict | None = None):
@@ -18,165 +22,242 @@ def update_analysis_status(outfit_id: str, status: str, results: dict | None = N
     Update the analysis status and results in the database.
     """
     try:
-        analysis_json = json.dumps(results) if results else None
-        execute_query(
+        # psycopg2 needs str, not the bytes orjson produces
+        analysis_json = orjson.dumps(results).decode() if results else None
+        result = execute_query(
             """
             UPDATE outfits
             SET analysis_status = %s, analysis_results = %s
             WHERE id = %s
+            RETURNING user_id
             """,
             (status, analysis_json, outfit_id),
+            fetch=True
         )
+        for (user_id,) in result or []:
+            invalidate_user_context(user_id)
     except Exception:
         logger.exception(
             "Error updating analysis status for outfit %s", outfit_id
         )
 
 
-def get_user_completed_outfits(user_id: str) -> list:
+def _keyset(before: Optional[datetime]) -> str:
+    """SQL fragment for keyset pagination on created_at."""
+    return "AND created_at < %s" if before else ""
+
+
+def get_user_completed_outfits(
+    user_id: str, limit: int = 50, before: Optional[datetime] = None
+) -> Optional[list]:
     """
-    Retrieve all completed outfits for a user with their analysis data.
+    Retrieve a page of completed outfits for a user with their analysis data.
     Used for matching suggestions context.
+
+    Pages are ordered newest first; pass the last created_at as `before`
+    to fetch the next page. Returns None if the query failed.
     """
     try:
+        params = (user_id, before, limit) if before else (user_id, limit)
         result = execute_query(
-            """
+            f"""
             SELECT id, name, analysis_results
             FROM outfits
-            WHERE user_id = %s AND analysis_status = 'completed'
+            WHERE user_id = %s AND analysis_status = 'completed' {_keyset(before)}
             ORDER BY created_at DESC
+            LIMIT %s
             """,
-            (user_id,),
+            params,
             fetch=True
         )
         return result or []
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception(
             "Error fetching completed outfits for user %s", user_id
         )
-        return []
+        return None
+
 
+def get_outfit_tags_if_owner(outfit_id: str, user_id: str) -> Optional[list]:
+    """
+    Get tags for an outfit owned by user_id as a list of strings.
 
-def get_outfit_tags(outfit_id: str) -> list[str]:
-    """Get tags for an outfit as a list of strings."""
+    Returns None if the outfit does not exist or belongs to someone else,
+    so ownership and tags come back in one query.
+    """
     try:
         result = execute_query_one(
-            "SELECT tags FROM outfits WHERE id = %s",
-            (outfit_id,)
+            "SELECT tags FROM outfits WHERE id = %s AND user_id = %s",
+            (outfit_id, user_id)
         )
-        if not result or not result[0]:
-            return []
-        return [tag.strip() for tag in result[0].split(",") if tag.strip()]
+        if not result:
+            return None
+        return result[0] or []
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Error fetching tags for outfit %s", outfit_id)
-        return []
+        return None
+
+
+def find_outfit_by_content_hash(user_id: str, content_hash: str) -> Optional[tuple]:
+    """
+    Find a user's outfit uploaded with the same image bytes.
+
+    Returns (id, image_path, name, tags, analysis_status) or None.
+    """
+    try:
+        return execute_query_one(
+            """
+            SELECT id, image_path, name, tags, analysis_status
+            FROM outfits
+            WHERE user_id = %s AND content_hash = %s
+            """,
+            (user_id, content_hash)
+        )
+    except PoolExhaustedError:
+        raise
+    except Exception:
+        logger.exception("Error looking up content hash for user %s", user_id)
+        return None
 
 
-def save_outfit_tags(outfit_id: str, tags: list[str]) -> bool:
-    """Save tags for an outfit as comma-separated string."""
+def save_outfit_tags(outfit_id: str, user_id: str, tags: list[str]) -> bool:
+    """Save tags for an outfit owned by user_id as a TEXT[] array."""
     try:
-        tags_str = ",".join(tags) if tags else ""
-        execute_query(
-            "UPDATE outfits SET tags = %s WHERE id = %s",
-            (tags_str, outfit_id),
+        result = execute_query_one(
+            "UPDATE outfits SET tags = %s WHERE id = %s AND user_id = %s RETURNING 1",
+            (list(tags or []), outfit_id, user_id)
         )
+        if not result:
+            return False
+        invalidate_user_context(user_id)
         return True
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Error saving tags for outfit %s", outfit_id)
         return False
 
 
+def invalidate_user_context(user_id: str) -> None:
+    """Drop the cached recommendation and matching context for a user."""
+    with _USER_CTX_LOCK:
+        _USER_CTX_CACHE.pop(user_id, None)
+        _MATCH_CTX_CACHE.pop(user_id, None)
+
+
+def get_matching_context(user_id: str, limit: int = 5) -> str:
+    """
+    Return the prompt snippet describing a user's recent completed outfits.
+
+    Only `limit` rows are fetched, and the rendered string is cached per user
+    for a short TTL and invalidated on writes.
+    """
+    with _USER_CTX_LOCK:
+        cached = _MATCH_CTX_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+
+    completed_outfits = get_user_completed_outfits(user_id, limit=limit)
+    if completed_outfits is None:
+        # Don't cache a transient failure as "no outfits"
+        return ""
+
+    outfit_context = ""
+    if completed_outfits:
+        outfit_context = "\n\nUser's other outfits for reference:\n"
+        for _, outfit_name, analysis in completed_outfits:
+            if isinstance(analysis, dict):
+                items = analysis.get("detected_items", [])
+                colors = analysis.get("colors", [])
+                outfit_context += f"- {outfit_name}: {', '.join(items[:3])} | Colors: {', '.join(colors[:2])}\n"
+
+    with _USER_CTX_LOCK:
+        _MATCH_CTX_CACHE[user_id] = outfit_context
+    return outfit_context
+
+
 def get_user_context(user_id: str) -> dict:
     """
     Retrieve user context for recommendations.
 
+    Results are cached per user for a short TTL and invalidated on writes.
+
     Returns a dict with:
-      - outfits: list of {id, name, tags, analysis}
+      - outfits: list of {id, name, tags, styles, colors}
       - favorites: list of outfit_ids
       - inferred_preferences: dict (counts of styles/colors)
     """
+    with _USER_CTX_LOCK:
+        cached = _USER_CTX_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+
+    context = _build_user_context(user_id)
+    if context is not None:
+        with _USER_CTX_LOCK:
+            _USER_CTX_CACHE[user_id] = context
+        return context
+    return {"outfits": [], "favorites": [], "inferred_preferences": {"styles": {}, "colors": {}}}
+
+
+def _build_user_context(user_id: str) -> dict | None:
+    """Query and assemble the recommendation context for a user."""
     try:
-        outfits = []
-        outfits_result = execute_query(
+        # Outfits, favorites and style/color tallies in one round-trip,
+        # tagged by row kind; the tallies are aggregated in Postgres.
+        rows = execute_query(
             """
-            SELECT id, name, tags, analysis_results
+            SELECT 'o' AS kind, id, name, tags, styles_arr, colors_arr, created_at,
+                   NULL::bigint AS n
             FROM outfits
             WHERE user_id = %s AND analysis_status = 'completed'
-            ORDER BY created_at DESC
+            UNION ALL
+            SELECT 'f' AS kind, outfit_id, NULL, NULL, NULL, NULL, created_at, NULL
+            FROM favorites
+            WHERE user_id = %s
+            UNION ALL
+            SELECT 's' AS kind, s, NULL, NULL, NULL, NULL, NULL, COUNT(*)
+            FROM outfits, unnest(styles_arr) AS s
+            WHERE user_id = %s AND analysis_status = 'completed'
+            GROUP BY s
+            UNION ALL
+            SELECT 'c' AS kind, c, NULL, NULL, NULL, NULL, NULL, COUNT(*)
+            FROM outfits, unnest(colors_arr) AS c
+            WHERE user_id = %s AND analysis_status = 'completed'
+            GROUP BY c
+            ORDER BY created_at DESC NULLS LAST, n DESC NULLS LAST
             """,
-            (user_id,),
+            (user_id, user_id, user_id, user_id),
             fetch=True
         )
-        
-        if outfits_result:
-            for r in outfits_result:
-                oid, name, tags_str, analysis_json = r
-                try:
-                    analysis = json.loads(analysis_json) if analysis_json else None
-                except Exception:
-                    analysis = None
-
-                tags = [t.strip() for t in tags_str.split(",") if t.strip()] if tags_str else []
 
+        outfits = []
+        favorites = []
+        inferred = {"styles": {}, "colors": {}}
+        for kind, oid, name, tags, styles, colors, _, n in rows or []:
+            if kind == "f":
+                favorites.append(oid)
+            elif kind == "s":
+                inferred["styles"][oid] = n
+            elif kind == "c":
+                inferred["colors"][oid] = n
+            else:
                 outfits.append({
                     "id": oid,
                     "name": name,
-                    "tags": tags,
-                    "analysis": analysis,
+                    "tags": tags or [],
+                    "styles": styles or [],
+                    "colors": colors or [],
                 })
 
-        # Favorites
-        fav_result = execute_query(
-            "SELECT outfit_id FROM favorites WHERE user_id = %s",
-            (user_id,),
-            fetch=True
-        )
-        favorites = [r[0] for r in fav_result] if fav_result else []
-
-        # Simple inferred preferences: tally styles and colors from analysis
-        inferred = {"styles": {}, "colors": {}}
-        for o in outfits:
-            a = o.get("analysis") or {}
-            for s in (a.get("styles") or []):
-                inferred["styles"][s] = inferred["styles"].get(s, 0) + 1
-            for c in (a.get("colors") or []):
-                inferred["colors"][c] = inferred["colors"].get(c, 0) + 1
-
         return {"outfits": outfits, "favorites": favorites, "inferred_preferences": inferred}
 
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Error building user context for %s", user_id)
-        return {"outfits": [], "favorites": [], "inferred_preferences": {"styles": {}, "colors": {}}}
-
-
-def search_outfits(user_id: str, query: str) -> list:
-    """
-    Search for outfits by query text across tags and analysis results.
-    
-    Args:
-        user_id: The ID of the user
-        query: The search query text
-    
-    Returns:
-        List of matching outfits (id, image_filename, name, tags, created_at, analysis_results)
-    """
-    try:
-        search_pattern = f"%{query}%"
-        result = execute_query(
-            """
-            SELECT id, image_filename, name, tags, created_at, analysis_results
-            FROM outfits
-            WHERE user_id = %s AND (
-                tags ILIKE %s OR 
-                name ILIKE %s OR 
-                analysis_results ILIKE %s
-            )
-            ORDER BY created_at DESC
-            """,
-            (user_id, search_pattern, search_pattern, search_pattern),
-            fetch=True
-        )
-        return result or []
-    except Exception:
-        logger.exception("Error searching outfits for user %s with query %s", user_id, query)
-        return []
+        return None
@@ -4,11 +4,19 @@ Handles connection pooling and schema initialization
 """
 
 import os
+import asyncio
 import logging
+import threading
+from contextvars import ContextVar
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
 import psycopg2
-from psycopg2 import sql, pool
+from psycopg2 import pool
+from psycopg2.extras import RealDictCursor, execute_values
 from contextlib import contextmanager
 
+from config import IS_VERCEL
+
 logger = logging.getLogger(__name__)
 
 # Get DATABASE_URL from environment
@@ -17,39 +25,187 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set")
 
-# Create connection pool
-try:
-    connection_pool = psycopg2.pool.SimpleConnectionPool(
-        1,  # min connection
-        20,  # max connection for serverless
-        DATABASE_URL,
-        connect_timeout=5
-    )
-except Exception as e:
-    logger.error(f"Failed to create connection pool: {e}")
-    raise
+# Serverless instances only ever need a couple of connections each;
+# Neon's PgBouncer does the real pooling server-side. psycopg2 pools only
+# keep PG_POOL_MIN idle connections around, so it must be at least 1 for
+# connections to be reused between requests.
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "3"))
+PG_CONNECT_TIMEOUT = int(os.getenv("PG_CONNECT_TIMEOUT", "5"))
+# How long a request waits for a free pooled connection before failing
+# with a 503; short so a saturated instance sheds load instead of queueing.
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "0.25"))
+# Background work (analysis, batched inserts) has no client waiting on a
+# quick answer, so it queues for a connection much longer.
+PG_BACKGROUND_POOL_TIMEOUT = float(os.getenv("PG_BACKGROUND_POOL_TIMEOUT", "10"))
+_checkout_timeout = ContextVar("pg_checkout_timeout", default=PG_POOL_TIMEOUT)
+
+connection_pool = None
+_pool_lock = threading.Lock()
+# psycopg2 raises as soon as the pool is exhausted; gate checkouts so
+# callers queue for a free connection instead.
+_pool_slots = threading.BoundedSemaphore(PG_POOL_MAX)
+
+
+class PoolExhaustedError(pool.PoolError):
+    """No pooled connection became free within the checkout timeout."""
+
+
+@contextmanager
+def background_checkouts():
+    """Use PG_BACKGROUND_POOL_TIMEOUT for connection checkouts in this context."""
+    token = _checkout_timeout.set(PG_BACKGROUND_POOL_TIMEOUT)
+    try:
+        yield
+    finally:
+        _checkout_timeout.reset(token)
+
+
+def _pooled_dsn(url: str) -> str:
+    """Route a Neon connection string through its PgBouncer pooler endpoint."""
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    if not host.endswith(".neon.tech"):
+        return url
+
+    if "-pooler." not in host:
+        endpoint, _, domain = host.partition(".")
+        pooled_host = f"{endpoint}-pooler.{domain}"
+        netloc = parts.netloc.replace(host, pooled_host, 1)
+        parts = parts._replace(netloc=netloc)
+
+    query = dict(parse_qsl(parts.query))
+    query.setdefault("sslmode", "require")
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def get_connection_pool():
+    """Create the connection pool on first use and reuse it across warm invocations."""
+    global connection_pool
+    if connection_pool is None:
+        with _pool_lock:
+            if connection_pool is None:
+                dsn = _pooled_dsn(DATABASE_URL) if IS_VERCEL else DATABASE_URL
+                try:
+                    connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                        PG_POOL_MIN,
+                        PG_POOL_MAX,
+                        dsn,
+                        connect_timeout=PG_CONNECT_TIMEOUT,
+                        keepalives=1,
+                        keepalives_idle=30,
+                        keepalives_interval=10,
+                        keepalives_count=3,
+                        application_name="psi-backend",
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to create connection pool: {e}")
+                    raise
+    return connection_pool
+
+
+def close_pool():
+    """Close every pooled connection (called on application shutdown)."""
+    global connection_pool
+    with _pool_lock:
+        if connection_pool is not None:
+            connection_pool.closeall()
+            connection_pool = None
+            logger.info("Database connection pool closed")
 
 
 @contextmanager
-def get_db_connection():
-    """Get a connection from the pool."""
+def get_db_connection(autocommit: bool = False):
+    """
+    Get a connection from the pool.
+
+    With autocommit=True each statement commits on its own, which skips the
+    extra BEGIN and COMMIT round-trips for single-statement work.
+    """
     conn = None
+    db_pool = get_connection_pool()
+    if not _pool_slots.acquire(timeout=_checkout_timeout.get()):
+        raise PoolExhaustedError("Timed out waiting for a database connection")
     try:
-        conn = connection_pool.getconn()
+        conn = db_pool.getconn()
+        if conn.autocommit != autocommit:
+            conn.autocommit = autocommit
         logger.debug("Database connection acquired from pool")
         yield conn
     except Exception as e:
         logger.error(f"Database connection error: {e}", exc_info=True)
         if conn:
-            connection_pool.putconn(conn, close=True)
+            db_pool.putconn(conn, close=True)
+            conn = None
         raise
     finally:
         if conn:
             try:
-                connection_pool.putconn(conn)
+                db_pool.putconn(conn)
                 logger.debug("Database connection returned to pool")
             except Exception as e:
                 logger.error(f"Error returning connection to pool: {e}")
+        _pool_slots.release()
+
+
+def _ping():
+    """Open a pooled connection and make sure it is usable."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+async def warm_pool(n: int = PG_POOL_MIN):
+    """Open n pooled connections concurrently so the first requests skip the handshake."""
+    if n <= 0:
+        return
+    try:
+        await asyncio.gather(*[asyncio.to_thread(_ping) for _ in range(n)])
+        logger.info(f"Warmed {n} database connection(s)")
+    except Exception as e:
+        logger.warning(f"Failed to warm connection pool: {e}")
+
+
+def _column_type(cursor, table: str, column: str):
+    """Return the data type of a column, or None if it does not exist."""
+    cursor.execute(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s
+        """,
+        (table, column),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _column_default(cursor, table: str, column: str):
+    """Return the default expression of a column as Postgres prints it, or None."""
+    cursor.execute(
+        """
+        SELECT column_default FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s
+        """,
+        (table, column),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _function_exists(cursor, signature: str) -> bool:
+    """Return True if a function with this signature, e.g. 'f(jsonb)', exists."""
+    cursor.execute("SELECT to_regprocedure(%s) IS NOT NULL", (signature,))
+    return cursor.fetchone()[0]
+
+
+def _trigger_exists(cursor, table: str, name: str) -> bool:
+    """Return True if the named trigger exists on a table."""
+    cursor.execute(
+        "SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass(%s) AND tgname = %s",
+        (table, name),
+    )
+    return cursor.fetchone() is not None
 
 
 def init_db():
@@ -67,20 +223,158 @@ def init_db():
                     image_path TEXT NOT NULL,
                     image_filename TEXT,
                     name TEXT,
-                    tags TEXT,
+                    tags TEXT[] DEFAULT '{}',
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     analysis_status TEXT DEFAULT 'pending',
-                    analysis_results TEXT
+                    analysis_results JSONB
                 );
             """)
             logger.info("Created outfits table")
             
-            # Create index for user_id
+            # Stamp rows in the database as naive UTC, matching the values the
+            # app used to send; clock_timestamp() keeps rows inserted in one
+            # batch distinct for keyset pagination. Only altered when needed,
+            # since ALTER TABLE takes an exclusive lock on outfits
+            if "clock_timestamp()" not in (_column_default(cursor, "outfits", "created_at") or ""):
+                cursor.execute("""
+                    ALTER TABLE outfits 
+                    ALTER COLUMN created_at SET DEFAULT (clock_timestamp() AT TIME ZONE 'UTC');
+                """)
+                logger.info("Set created_at default to clock_timestamp() in UTC")
+            
+            # Migrate legacy TEXT analysis_results to JSONB
+            if _column_type(cursor, "outfits", "analysis_results") == "text":
+                cursor.execute("DROP INDEX IF EXISTS idx_outfits_analysis_results_trgm;")
+                cursor.execute("""
+                    ALTER TABLE outfits 
+                    ALTER COLUMN analysis_results TYPE JSONB 
+                    USING analysis_results::jsonb;
+                """)
+                logger.info("Migrated analysis_results to JSONB")
+            
+            # Migrate legacy comma-separated tags to TEXT[]
+            if _column_type(cursor, "outfits", "tags") == "text":
+                cursor.execute("DROP INDEX IF EXISTS idx_outfits_tags_trgm;")
+                cursor.execute(r"""
+                    ALTER TABLE outfits 
+                    ALTER COLUMN tags TYPE TEXT[] 
+                    USING array_remove(
+                        regexp_split_to_array(btrim(tags, ' ,'), '\s*,\s*'), ''
+                    );
+                """)
+                cursor.execute("ALTER TABLE outfits ALTER COLUMN tags SET DEFAULT '{}';")
+                logger.info("Migrated tags to TEXT[]")
+            
+            # Styles/colors derived from the analysis on write, so readers
+            # never need to parse analysis_results. Functions and columns are
+            # created only when missing: ALTER TABLE locks outfits exclusively
+            # even with IF NOT EXISTS, and replacing a function from several
+            # cold starts at once can fail with "tuple concurrently updated"
+            if not _function_exists(cursor, "jsonb_to_text_array(jsonb)"):
+                cursor.execute("""
+                    CREATE FUNCTION jsonb_to_text_array(j JSONB) 
+                    RETURNS TEXT[] LANGUAGE sql IMMUTABLE AS $$
+                        SELECT CASE WHEN jsonb_typeof(j) = 'array'
+                            THEN ARRAY(SELECT jsonb_array_elements_text(j))
+                            ELSE '{}'::TEXT[] END
+                    $$;
+                """)
+            for column, key in (("styles_arr", "styles"), ("colors_arr", "colors")):
+                if _column_type(cursor, "outfits", column) is None:
+                    cursor.execute(f"""
+                        ALTER TABLE outfits ADD COLUMN {column} TEXT[] 
+                        GENERATED ALWAYS AS (jsonb_to_text_array(analysis_results->'{key}')) STORED;
+                    """)
+                # Only ever read via unnest() per user, which no GIN index serves
+                cursor.execute(f"DROP INDEX IF EXISTS idx_outfits_{column}_gin;")
+            logger.info("Created styles_arr and colors_arr columns")
+            
+            # Composite index so paginated listings are an index range scan;
+            # its user_id prefix also serves plain user_id lookups
+            cursor.execute("DROP INDEX IF EXISTS idx_outfits_user_id;")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outfits_user_created 
+                ON outfits(user_id, created_at DESC);
+            """)
+            logger.info("Created index on user_id, created_at")
+            
+            # Composite index for per-user listings filtered by status
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outfits_user_status_created 
+                ON outfits(user_id, analysis_status, created_at DESC);
+            """)
+            logger.info("Created index on user_id, analysis_status, created_at")
+            
+            # Trigram indexes so ILIKE '%q%' search can avoid sequential scans
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outfits_name_trgm 
+                ON outfits USING gin (name gin_trgm_ops);
+            """)
+            # Search no longer matches analysis text; a trigram index over the
+            # JSON would only slow down every analysis update
+            cursor.execute("DROP INDEX IF EXISTS idx_outfits_analysis_text_trgm;")
+            # Tags flattened into one string so tag search can use a trigram
+            # index; the unit separator keeps a pattern from spanning two tags
+            if not _function_exists(cursor, "tags_to_text(text[])"):
+                cursor.execute("""
+                    CREATE FUNCTION tags_to_text(t TEXT[]) 
+                    RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+                        SELECT array_to_string(t, chr(31))
+                    $$;
+                """)
+            if _column_type(cursor, "outfits", "tags_text") is None:
+                cursor.execute("""
+                    ALTER TABLE outfits ADD COLUMN tags_text TEXT 
+                    GENERATED ALWAYS AS (tags_to_text(tags)) STORED;
+                """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outfits_tags_text_trgm 
+                ON outfits USING gin (tags_text gin_trgm_ops);
+            """)
+            logger.info("Created trigram indexes for search")
+            
+            # Nothing queries tags with @>, && or ANY(); tag search goes
+            # through the tags_text trigram index instead
+            cursor.execute("DROP INDEX IF EXISTS idx_outfits_tags_gin;")
+            
+            # Per-user hash of the uploaded bytes so re-uploads are detected
+            if _column_type(cursor, "outfits", "content_hash") is None:
+                cursor.execute("ALTER TABLE outfits ADD COLUMN content_hash TEXT;")
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_outfits_user_content_hash 
+                ON outfits(user_id, content_hash);
+            """)
+            logger.info("Created unique index on user_id, content_hash")
+            
+            # Per-user version counter bumped by any write to a user's outfits,
+            # so search ETags are a primary-key lookup instead of a scan
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_outfits_user_id 
-                ON outfits(user_id);
+                CREATE TABLE IF NOT EXISTS outfit_versions (
+                    user_id TEXT PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
+                );
             """)
-            logger.info("Created index on user_id")
+            if not _function_exists(cursor, "bump_outfit_version()"):
+                cursor.execute("""
+                    CREATE FUNCTION bump_outfit_version() 
+                    RETURNS trigger LANGUAGE plpgsql AS $$
+                    BEGIN
+                        INSERT INTO outfit_versions (user_id, version)
+                        VALUES (COALESCE(NEW.user_id, OLD.user_id), 1)
+                        ON CONFLICT (user_id)
+                        DO UPDATE SET version = outfit_versions.version + 1;
+                        RETURN NULL;
+                    END
+                    $$;
+                """)
+            if not _trigger_exists(cursor, "outfits", "outfits_bump_version"):
+                cursor.execute("""
+                    CREATE TRIGGER outfits_bump_version 
+                    AFTER INSERT OR UPDATE OR DELETE ON outfits 
+                    FOR EACH ROW EXECUTE FUNCTION bump_outfit_version();
+                """)
+            logger.info("Created outfit version counter")
             
             # Create favorites table
             cursor.execute("""
@@ -94,12 +388,14 @@ def init_db():
             """)
             logger.info("Created favorites table")
             
-            # Create index for favorites
+            # (user_id, outfit_id) lookups use the UNIQUE constraint's index;
+            # listings by user use this one, so a user_id-only index is redundant
+            cursor.execute("DROP INDEX IF EXISTS idx_favorites_user_id;")
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_favorites_user_id 
-                ON favorites(user_id);
+                CREATE INDEX IF NOT EXISTS idx_favorites_user_created 
+                ON favorites(user_id, created_at DESC);
             """)
-            logger.info("Created index on favorites user_id")
+            logger.info("Created index on favorites user_id, created_at")
             
             conn.commit()
             logger.info("Database tables initialized successfully")
@@ -110,38 +406,72 @@ def init_db():
 
 
 def execute_query(query: str, params: tuple = None, fetch: bool = False):
-    """Execute a database query."""
+    """Execute a single-statement query in autocommit mode."""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            logger.debug(f"Executing query: {query[:100]}... with params: {params}")
-            cursor.execute(query, params or ())
-            
-            if fetch:
-                result = cursor.fetchall()
-                logger.debug(f"Query returned {len(result)} rows")
-            else:
-                result = None
-            
-            conn.commit()
-            return result
+        with get_db_connection(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                logger.debug("Executing query: %.100s... with params: %s", query, params)
+                cursor.execute(query, params or ())
+                
+                if fetch:
+                    result = cursor.fetchall()
+                    logger.debug("Query returned %s rows", len(result))
+                else:
+                    result = None
+                
+                return result
             
     except Exception as e:
         logger.error(f"Database query error: {e}", exc_info=True)
         raise
 
 
-def execute_query_one(query: str, params: tuple = None):
-    """Execute a query and fetch one result."""
+def execute_values_query(query: str, rows: list, page_size: int = 100):
+    """
+    Insert or update many rows in batched statements.
+
+    `query` must contain a single `VALUES %s` placeholder; rows are sent
+    page_size at a time, so K rows cost K / page_size round-trips.
+    """
+    if not rows:
+        return
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            logger.debug(f"Executing single query: {query[:100]}... with params: {params}")
-            cursor.execute(query, params or ())
-            result = cursor.fetchone()
-            logger.debug(f"Query returned: {result is not None}")
-            return result
+            logger.debug("Executing batch query: %.100s... with %s rows", query, len(rows))
+            execute_values(cursor, query, rows, page_size=page_size)
+            conn.commit()
+
+    except Exception as e:
+        logger.error(f"Database batch query error: {e}", exc_info=True)
+        raise
+
+
+def execute_query_one(query: str, params: tuple = None):
+    """Execute a query in autocommit mode and fetch one result."""
+    try:
+        with get_db_connection(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                logger.debug("Executing single query: %.100s... with params: %s", query, params)
+                cursor.execute(query, params or ())
+                result = cursor.fetchone()
+                logger.debug("Query returned: %s", result is not None)
+                return result
             
     except Exception as e:
         logger.error(f"Database query error: {e}", exc_info=True)
         raise
+
+
+def fetch_one_dict(query: str, params: tuple = None):
+    """Execute a query in autocommit mode and fetch one row as a column-name dict."""
+    try:
+        with get_db_connection(autocommit=True) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                logger.debug("Executing single query: %.100s... with params: %s", query, params)
+                cursor.execute(query, params or ())
+                return cursor.fetchone()
+
+    except Exception as e:
+        logger.error(f"Database query error: {e}", exc_info=True)
+        raise
@@ -0,0 +1,109 @@
+"""
+Batched outfit inserts
+Coalesces concurrent upload inserts into one multi-row INSERT per short window
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from .postgres import background_checkouts, execute_query, execute_values_query
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ROWS = 500
+BATCH_WINDOW_SECONDS = 0.02  # 20ms
+
+_OUTFIT_COLUMNS = """
+    id,
+    user_id,
+    image_path,
+    image_filename,
+    name,
+    tags,
+    analysis_status,
+    content_hash
+"""
+INSERT_OUTFITS_SQL = f"INSERT INTO outfits ({_OUTFIT_COLUMNS}) VALUES %s"
+INSERT_OUTFIT_SQL = f"INSERT INTO outfits ({_OUTFIT_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+
+_queue: Optional[asyncio.Queue] = None
+_flusher: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _ensure_flusher() -> asyncio.Queue:
+    """Start the flush loop on the running event loop if it is not already running."""
+    global _queue, _flusher, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop or _flusher is None or _flusher.done():
+        _queue = asyncio.Queue()
+        _flusher = loop.create_task(_flush_loop(_queue))
+        _loop = loop
+    return _queue
+
+
+async def insert_outfit(row: tuple) -> None:
+    """
+    Insert one outfit row, batched with any others arriving in the same window.
+
+    Resolves once the row is committed and raises if its insert failed.
+    """
+    queue = _ensure_flusher()
+    done = asyncio.get_running_loop().create_future()
+    await queue.put((row, done))
+    await done
+
+
+async def _flush_loop(queue: asyncio.Queue) -> None:
+    """Drain up to BATCH_MAX_ROWS rows or one window's worth, then write them together."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_SECONDS
+        while len(batch) < BATCH_MAX_ROWS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Callers await the result off the event loop, so a busy pool is
+        # worth queueing for rather than failing the upload
+        with background_checkouts():
+            await _write_batch(batch)
+
+
+def _resolve(done: asyncio.Future, error: Optional[BaseException] = None) -> None:
+    """Complete a caller's future unless it was already cancelled."""
+    if done.done():
+        return
+    if error is None:
+        done.set_result(None)
+    else:
+        done.set_exception(error)
+
+
+async def _write_batch(batch: list) -> None:
+    """Commit a batch in one statement; on failure retry row by row so only bad rows fail."""
+    rows = [row for row, _ in batch]
+    try:
+        await asyncio.to_thread(execute_values_query, INSERT_OUTFITS_SQL, rows, BATCH_MAX_ROWS)
+    except Exception as e:
+        if len(batch) == 1:
+            _resolve(batch[0][1], e)
+            return
+        logger.warning("Batched insert of %d outfits failed, retrying individually", len(batch))
+        for row, done in batch:
+            try:
+                await asyncio.to_thread(execute_query, INSERT_OUTFIT_SQL, row)
+            except Exception as row_error:
+                _resolve(done, row_error)
+            else:
+                _resolve(done)
+        return
+
+    logger.debug("Inserted %d outfit row(s) in one batch", len(rows))
+    for _, done in batch:
+        _resolve(done)
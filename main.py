@@ -4,13 +4,13 @@ Version: 1.0.1 (cleaned imports)
 """
 
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Configure logging
 logging.basicConfig(
@@ -22,13 +22,11 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini ONCE (fail fast)
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
+# Fail fast on a missing Gemini key; the SDK itself is imported lazily
+# (see utils.gemini.get_genai) to keep cold starts cheap.
+if not os.getenv("GOOGLE_API_KEY"):
     raise RuntimeError("GOOGLE_API_KEY not set. Please add it to your .env file.")
 
-genai.configure(api_key=api_key)
-
 # Validate required environment variables
 required_env_vars = {
     "DATABASE_URL": "PostgreSQL database connection string",
@@ -49,8 +47,7 @@ else:
     logger.info("All required environment variables are set")
 
 # Local imports
-from config import UPLOADS_DIR
-from database.postgres import init_db
+from database.postgres import PoolExhaustedError, init_db, warm_pool, close_pool
 from routers import (
     health,
     quotes,
@@ -65,10 +62,27 @@ from routers import (
     recommendations,
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the schema and warm the connection pool concurrently; close it on shutdown."""
+    try:
+        logger.info("Starting up application...")
+        await asyncio.gather(asyncio.to_thread(init_db), warm_pool())
+        logger.info("Application startup complete")
+    except Exception as e:
+        logger.error(f"Application startup failed: {e}", exc_info=True)
+        raise
+    yield
+    close_pool()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Fashion Style Recommender API",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Enable CORS (placed immediately after app creation)
@@ -90,30 +104,26 @@ async def preflight_handler(full_path: str):
     return {"message": "OK"}
 
 
+@app.exception_handler(PoolExhaustedError)
+async def pool_exhausted_handler(request, exc):
+    """All database connections are busy; ask the client to retry shortly"""
+    logger.warning("Database pool exhausted for %s", request.url.path)
+    return ORJSONResponse(
+        status_code=503,
+        content={"success": False, "detail": "Service busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler for unhandled errors"""
     logger.exception(f"Unhandled exception: {str(exc)}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"success": False, "detail": "Internal server error"},
     )
 
-@app.on_event("startup")
-def on_startup():
-    try:
-        logger.info("Starting up application...")
-        init_db()
-        logger.info("Application startup complete")
-    except Exception as e:
-        logger.error(f"Application startup failed: {e}", exc_info=True)
-        raise
-
-# Mount uploads directory
-app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR), name="uploads")
-
-# (CORS middleware moved to immediately after app creation)
-
 # Root endpoint
 @app.get("/")
 async def root():
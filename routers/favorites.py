@@ -1,8 +1,11 @@
 import logging
-from pathlib import Path
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 
-from database.postgres import execute_query, execute_query_one, get_db_connection
+from database.db import invalidate_user_context
+from database.postgres import PoolExhaustedError, execute_query, execute_query_one, get_db_connection
+from utils.ids import is_valid_outfit_id
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -11,41 +14,32 @@ logger = logging.getLogger(__name__)
 # =========================
 # DB helpers
 # =========================
-def verify_outfit_ownership(outfit_id: str, user_id: str) -> bool:
-    """Check if user owns the outfit."""
-    try:
-        result = execute_query_one(
-            "SELECT user_id FROM outfits WHERE id = %s",
-            (outfit_id,),
-        )
-        if not result:
-            return False
-        return result[0] == user_id
-    except Exception:
-        logger.exception("Database error verifying outfit ownership")
-        return False
-
-
 def add_favorite(outfit_id: str, user_id: str) -> bool:
-    """Add outfit to user's favorites. Returns True if added, False if already favorited."""
+    """
+    Add outfit to user's favorites if the user owns it.
+
+    Ownership check and insert run as one statement, which also reports the
+    owner so a no-op insert can be explained without a second query. Returns
+    True if added, False if already favorited; raises 403/404 if the user
+    cannot favorite it.
+    """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute(
-                    """
-                    INSERT INTO favorites (user_id, outfit_id)
-                    VALUES (%s, %s)
-                    """,
-                    (user_id, outfit_id),
-                )
-                conn.commit()
-                return True
-            except Exception as e:
-                # Check if it's a unique constraint violation
-                if "unique" in str(e).lower():
-                    return False
-                raise
+        owner, added = execute_query_one(
+            """
+            WITH target AS (
+                SELECT id, user_id FROM outfits WHERE id = %s
+            ), inserted AS (
+                INSERT INTO favorites (user_id, outfit_id)
+                SELECT %s, id FROM target WHERE user_id = %s
+                ON CONFLICT (user_id, outfit_id) DO NOTHING
+                RETURNING 1
+            )
+            SELECT (SELECT user_id FROM target), EXISTS (SELECT 1 FROM inserted)
+            """,
+            (outfit_id, user_id, user_id),
+        )
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Database error adding favorite")
         raise HTTPException(
@@ -53,6 +47,20 @@ def add_favorite(outfit_id: str, user_id: str) -> bool:
             detail="Database error while adding favorite",
         )
 
+    if added:
+        invalidate_user_context(user_id)
+        return True
+
+    # Nothing inserted: already favorited, not found, or not the owner
+    if owner == user_id:
+        return False
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Outfit not found")
+    raise HTTPException(
+        status_code=403,
+        detail="You can only favorite your own outfits",
+    )
+
 
 def remove_favorite(outfit_id: str, user_id: str) -> bool:
     """Remove outfit from user's favorites. Returns True if removed, False if not found."""
@@ -67,44 +75,46 @@ def remove_favorite(outfit_id: str, user_id: str) -> bool:
                 (user_id, outfit_id),
             )
             conn.commit()
+            invalidate_user_context(user_id)
             return cursor.rowcount > 0
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Database error removing favorite")
         raise HTTPException(
             status_code=500,
             detail="Database error while removing favorite",
         )
-def is_outfit_favorited(outfit_id: str, user_id: str) -> bool:
-    """Check if outfit is favorited by user."""
-    try:
-        result = execute_query_one(
-            """
-            SELECT 1 FROM favorites
-            WHERE user_id = %s AND outfit_id = %s
-            """,
-            (user_id, outfit_id),
-        )
-        return result is not None
-    except Exception:
-        logger.exception("Database error checking favorite status")
-        return False
 
 
-def get_user_favorites(user_id: str) -> list:
-    """Retrieve all favorited outfits for a user with user's own outfits only."""
+def get_user_favorites(
+    user_id: str, limit: int = 50, before: Optional[datetime] = None
+) -> list:
+    """
+    Retrieve a page of favorited outfits for a user with user's own outfits only.
+
+    Pages are ordered by when the outfit was favorited, newest first; pass the
+    last favorited_at as `before` to fetch the next page.
+    """
+    keyset = "AND f.created_at < %s" if before else ""
+    params = (user_id, user_id, before, limit) if before else (user_id, user_id, limit)
     try:
         result = execute_query(
-            """
-            SELECT o.id, o.image_path, o.name, o.tags, o.created_at
+            f"""
+            SELECT o.id, o.image_path, o.name, o.tags, o.created_at,
+                   f.created_at AS favorited_at
             FROM outfits o
             INNER JOIN favorites f ON o.id = f.outfit_id
-            WHERE f.user_id = %s AND o.user_id = %s
+            WHERE f.user_id = %s AND o.user_id = %s {keyset}
             ORDER BY f.created_at DESC
+            LIMIT %s
             """,
-            (user_id, user_id),
+            params,
             fetch=True
         )
         return result or []
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Database error fetching favorites for user %s", user_id)
         return []
@@ -117,9 +127,7 @@ def format_outfit(outfit_tuple: tuple) -> dict:
         "id": outfit_tuple[0],
         "image_url": image_url,
         "name": outfit_tuple[2],
-        "tags": [tag.strip() for tag in outfit_tuple[3].split(",")]
-        if outfit_tuple[3]
-        else [],
+        "tags": outfit_tuple[3] or [],
         "date": outfit_tuple[4],
     }
 
@@ -128,20 +136,14 @@ def format_outfit(outfit_tuple: tuple) -> dict:
 # API endpoints
 # =========================
 @router.post("/api/outfits/{outfit_id}/favorite")
-async def add_outfit_to_favorites(outfit_id: str, user_id: str):
+def add_outfit_to_favorites(outfit_id: str, user_id: str):
     """Add outfit to user's favorites."""
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
 
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
 
-    if not verify_outfit_ownership(outfit_id, user_id):
-        raise HTTPException(
-            status_code=403,
-            detail="You can only favorite your own outfits",
-        )
-
     result = add_favorite(outfit_id, user_id)
 
     return {
@@ -152,10 +154,10 @@ async def add_outfit_to_favorites(outfit_id: str, user_id: str):
 
 
 @router.delete("/api/outfits/{outfit_id}/favorite")
-async def remove_outfit_from_favorites(outfit_id: str, user_id: str):
+def remove_outfit_from_favorites(outfit_id: str, user_id: str):
     """Remove outfit from user's favorites."""
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
 
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
@@ -170,14 +172,24 @@ async def remove_outfit_from_favorites(outfit_id: str, user_id: str):
 
 
 @router.get("/api/outfits/favorites")
-async def get_favorites(user_id: str):
-    """Get all outfits favorited by the authenticated user."""
+def get_favorites(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[datetime] = None,
+):
+    """
+    Get a page of outfits favorited by the authenticated user.
+
+    `next_cursor` is the value to pass as `cursor` for the next page, or null
+    once the last page has been returned.
+    """
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
 
-    outfits = get_user_favorites(user_id)
+    outfits = get_user_favorites(user_id, limit, cursor)
 
     return {
         "success": True,
         "data": [format_outfit(outfit) for outfit in outfits],
+        "next_cursor": outfits[-1][5] if len(outfits) == limit else None,
     }
@@ -1,97 +1,79 @@
-import json
 import logging
-from pathlib import Path
 from typing import Optional
 from fastapi import APIRouter, HTTPException
 
-from database.postgres import execute_query, execute_query_one
+from database.postgres import PoolExhaustedError, fetch_one_dict
+from utils.ids import is_valid_outfit_id
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-def is_outfit_favorited(outfit_id: str, user_id: str) -> bool:
-    """Check if outfit is favorited by user."""
+def get_outfit_from_db(outfit_id: str, user_id: str) -> Optional[dict]:
+    """Retrieve outfit from database along with whether user_id favorited it."""
     try:
-        result = execute_query_one(
+        result = fetch_one_dict(
             """
-            SELECT 1 FROM favorites
-            WHERE user_id = %s AND outfit_id = %s
+            SELECT o.id, o.image_path, o.name, o.tags, o.created_at, o.user_id,
+                   COALESCE(o.analysis_status, 'pending') AS analysis_status,
+                   o.analysis_results,
+                   (f.outfit_id IS NOT NULL) AS is_favorite
+            FROM outfits o
+            LEFT JOIN favorites f ON f.outfit_id = o.id AND f.user_id = %s
+            WHERE o.id = %s
             """,
             (user_id, outfit_id),
         )
-        return result is not None
-    except Exception:
-        logger.exception("Database error checking favorite status")
-        return False
-
-
-def get_outfit_from_db(outfit_id: str) -> Optional[tuple]:
-    """Retrieve outfit from database."""
-    try:
-        result = execute_query_one(
-            """
-            SELECT id, image_path, name, tags, created_at, user_id,
-                   COALESCE(analysis_status, 'pending') AS analysis_status,
-                   analysis_results
-            FROM outfits
-            WHERE id = %s
-            """,
-            (outfit_id,),
-        )
         return result
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Database error fetching outfit %s", outfit_id)
         return None
 
 
-def format_outfit_detail(outfit_tuple: tuple, user_id: str) -> Optional[dict]:
+def format_outfit_detail(outfit: dict) -> Optional[dict]:
     """Format detailed outfit response."""
-    if not outfit_tuple:
+    if not outfit:
         return None
 
-    image_url = outfit_tuple[1]  # image_path from DB (Cloudinary URL)
-    analysis_status = outfit_tuple[6] or "pending"
+    analysis_status = outfit["analysis_status"] or "pending"
     analysis = None
 
-    if outfit_tuple[7] and analysis_status == "completed":
-        try:
-            analysis = json.loads(outfit_tuple[7])
-        except (json.JSONDecodeError, TypeError):
-            analysis = None
+    # analysis_results is JSONB, so psycopg2 already returns a dict
+    if isinstance(outfit["analysis_results"], dict) and analysis_status == "completed":
+        analysis = outfit["analysis_results"]
 
     return {
-        "id": outfit_tuple[0],
-        "image_url": image_url,
-        "name": outfit_tuple[2],
-        "tags": [tag.strip() for tag in outfit_tuple[3].split(",")]
-        if outfit_tuple[3]
-        else [],
-        "date": outfit_tuple[4],
+        "id": outfit["id"],
+        "image_url": outfit["image_path"],  # Cloudinary URL
+        "name": outfit["name"],
+        "tags": outfit["tags"] or [],
+        "date": outfit["created_at"],
         "analysis_status": analysis_status,
         "analysis": analysis,
-        "is_favorite": is_outfit_favorited(outfit_tuple[0], user_id),
+        "is_favorite": outfit["is_favorite"],
     }
 
 
 @router.get("/api/outfits/{outfit_id}")
-async def get_outfit_detail(outfit_id: str, user_id: str):
+def get_outfit_detail(outfit_id: str, user_id: str):
     """Get detailed information for a specific outfit with analysis."""
 
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
 
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
 
-    outfit = get_outfit_from_db(outfit_id)
+    outfit = get_outfit_from_db(outfit_id, user_id)
     if not outfit:
         raise HTTPException(status_code=404, detail="Outfit not found")
 
-    if outfit[5] != user_id:
+    if outfit["user_id"] != user_id:
         raise HTTPException(status_code=403, detail="You do not have permission to view this outfit")
 
     return {
         "success": True,
-        "data": format_outfit_detail(outfit, user_id),
+        "data": format_outfit_detail(outfit),
     }
@@ -1,28 +1,41 @@
 import logging
-from pathlib import Path
+from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
-from database.postgres import execute_query
+from database.postgres import PoolExhaustedError, execute_query
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-def get_user_outfits(user_id: str) -> Optional[list]:
-    """Retrieve all outfits for a user."""
+def get_user_outfits(
+    user_id: str, limit: int = 50, before: Optional[datetime] = None
+) -> Optional[list]:
+    """
+    Retrieve a page of outfits for a user, newest first.
+
+    Pass the last created_at as `before` to fetch the next page.
+    """
+    keyset = "AND o.created_at < %s" if before else ""
+    params = (user_id, before, limit) if before else (user_id, limit)
     try:
         result = execute_query(
-            """
-            SELECT id, image_path, name, tags, created_at
-            FROM outfits
-            WHERE user_id = %s
-            ORDER BY created_at DESC
+            f"""
+            SELECT o.id, o.image_path, o.name, o.tags, o.created_at,
+                   (f.outfit_id IS NOT NULL) AS is_favorite
+            FROM outfits o
+            LEFT JOIN favorites f ON f.outfit_id = o.id AND f.user_id = o.user_id
+            WHERE o.user_id = %s {keyset}
+            ORDER BY o.created_at DESC
+            LIMIT %s
             """,
-            (user_id,),
+            params,
             fetch=True
         )
         return result
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Database error fetching outfits for user %s", user_id)
         return None
@@ -35,25 +48,34 @@ def format_outfit(outfit_tuple: tuple) -> dict:
         "id": outfit_tuple[0],
         "image_url": image_url,
         "name": outfit_tuple[2],
-        "tags": [tag.strip() for tag in outfit_tuple[3].split(",")]
-        if outfit_tuple[3]
-        else [],
+        "tags": outfit_tuple[3] or [],
         "date": outfit_tuple[4],
+        "is_favorite": outfit_tuple[5],
     }
 
 
 @router.get("/api/outfits")
-async def get_all_outfits(user_id: str):
-    """Get all outfits for a specific user."""
+def get_all_outfits(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[datetime] = None,
+):
+    """
+    Get a page of outfits for a specific user.
+
+    `next_cursor` is the created_at to pass as `cursor` for the next page,
+    or null once the last page has been returned.
+    """
 
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
 
-    outfits = get_user_outfits(user_id)
+    outfits = get_user_outfits(user_id, limit, cursor)
     if outfits is None:
         raise HTTPException(status_code=500, detail="Failed to fetch outfits")
 
     return {
         "success": True,
         "data": [format_outfit(outfit) for outfit in outfits],
+        "next_cursor": outfits[-1][4] if len(outfits) == limit else None,
     }
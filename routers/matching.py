@@ -1,15 +1,22 @@
-import json
+import re
+import asyncio
 import logging
 from typing import Optional
+
+import orjson
 from fastapi import APIRouter, HTTPException
-import google.generativeai as genai
 
-from database.db import get_user_completed_outfits
-from database.postgres import execute_query_one
+from database.db import get_matching_context
+from database.postgres import PoolExhaustedError, execute_query_one
+from utils.gemini import get_model
+from utils.ids import is_valid_outfit_id
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Outermost JSON array in the reply, with or without ``` fences around it
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.S)
+
 
 def get_outfit_from_db(outfit_id: str) -> Optional[tuple]:
     """Retrieve outfit from database."""
@@ -23,33 +30,20 @@ def get_outfit_from_db(outfit_id: str) -> Optional[tuple]:
             (outfit_id,),
         )
         return result
+    except PoolExhaustedError:
+        raise
     except Exception:
         logger.exception("Database error fetching outfit %s", outfit_id)
         return None
 
 
-def generate_matching_suggestions(outfit_id: str, outfit_data: dict, user_id: str) -> Optional[dict]:
+async def generate_matching_suggestions(outfit_id: str, outfit_data: dict, user_id: str) -> Optional[dict]:
     """
     Generate matching suggestions for an outfit using Gemini Vision API.
     """
     try:
-        # Get user's other completed outfits for context
-        completed_outfits = get_user_completed_outfits(user_id)
-        
-        # Build context from user's outfits
-        outfit_context = ""
-        if completed_outfits:
-            outfit_context = "\n\nUser's other outfits for reference:\n"
-            for outfit in completed_outfits[:5]:  # Limit to 5 for token efficiency
-                outfit_id_db, outfit_name, analysis_results = outfit
-                if analysis_results:
-                    try:
-                        analysis = json.loads(analysis_results)
-                        items = analysis.get("detected_items", [])
-                        colors = analysis.get("colors", [])
-                        outfit_context += f"- {outfit_name}: {', '.join(items[:3])} | Colors: {', '.join(colors[:2])}\n"
-                    except (json.JSONDecodeError, TypeError):
-                        pass
+        # Context from the user's 5 most recent completed outfits (cached)
+        outfit_context = await asyncio.to_thread(get_matching_context, user_id)
 
         # Prepare the prompt
         prompt = f"""
@@ -85,25 +79,21 @@ Format your response as a JSON array with this structure:
 Return ONLY the JSON array, no additional text.
 """
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
+        # Run the blocking SDK call in a worker thread so the event loop stays free
+        model = get_model("gemini-2.5-flash")
+        response = await asyncio.to_thread(model.generate_content, prompt)
         
         if not response.text:
             logger.error("Empty response from Gemini API")
             return None
 
         # Parse the response
-        suggestions_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if suggestions_text.startswith("```json"):
-            suggestions_text = suggestions_text[7:]
-        if suggestions_text.startswith("```"):
-            suggestions_text = suggestions_text[3:]
-        if suggestions_text.endswith("```"):
-            suggestions_text = suggestions_text[:-3]
-        
-        suggestions = json.loads(suggestions_text.strip())
+        match = _JSON_ARRAY_RE.search(response.text)
+        if not match:
+            logger.error("No JSON array found in Gemini response")
+            return None
+
+        suggestions = orjson.loads(match.group(0))
         
         if not isinstance(suggestions, list):
             logger.error("Suggestions response is not a list")
@@ -114,9 +104,11 @@ Return ONLY the JSON array, no additional text.
             "status": "completed"
         }
 
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logger.error("Failed to parse LLM response as JSON: %s", e)
         return None
+    except PoolExhaustedError:
+        raise
     except Exception as e:
         logger.error("Error generating matching suggestions: %s", e)
         return None
@@ -134,14 +126,14 @@ async def get_matching_suggestions(outfit_id: str, user_id: str):
     - Fashion best practices
     """
     
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
 
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
 
     # Get outfit from database
-    outfit = get_outfit_from_db(outfit_id)
+    outfit = await asyncio.to_thread(get_outfit_from_db, outfit_id)
     if not outfit:
         raise HTTPException(status_code=404, detail="Outfit not found")
 
@@ -155,13 +147,13 @@ async def get_matching_suggestions(outfit_id: str, user_id: str):
     if not analysis_results:
         raise HTTPException(status_code=400, detail="Outfit analysis must be completed before generating matching suggestions")
 
-    try:
-        outfit_data = json.loads(analysis_results)
-    except (json.JSONDecodeError, TypeError):
+    # analysis_results is JSONB, so psycopg2 already returns a dict
+    if not isinstance(analysis_results, dict):
         raise HTTPException(status_code=500, detail="Failed to parse outfit analysis data")
+    outfit_data = analysis_results
 
     # Generate suggestions
-    result = generate_matching_suggestions(outfit_id_db, outfit_data, user_id)
+    result = await generate_matching_suggestions(outfit_id_db, outfit_data, user_id)
     
     if not result:
         raise HTTPException(status_code=500, detail="Failed to generate matching suggestions")
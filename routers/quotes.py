@@ -1,20 +1,17 @@
 import os
+import asyncio
+import threading
+from cachetools import TTLCache
 from fastapi import APIRouter, HTTPException
-import google.generativeai as genai
-from dotenv import load_dotenv
 
-load_dotenv()
+from utils.gemini import get_model
 
 router = APIRouter()
 
-# Initialize Google Generative AI
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    print("Warning: GOOGLE_API_KEY not found in environment variables.")
-    genai_configured = False
-else:
-    genai.configure(api_key=api_key)
-    genai_configured = True
+# Bursts of clients within the TTL share a single generated quote
+_QUOTE_CACHE = TTLCache(maxsize=1, ttl=60)
+_QUOTE_LOCK = threading.Lock()
+_QUOTE_KEY = "quote"
 
 
 @router.get("/api/random-quote")
@@ -26,22 +23,31 @@ async def get_random_quote():
     Returns:
         JSON response with AI-generated random quote
     """
-    if not genai_configured:
+    if not os.getenv("GOOGLE_API_KEY"):
         raise HTTPException(
             status_code=500,
             detail="Google API key not configured. Please set GOOGLE_API_KEY in your .env file."
         )
     
     try:
-        # Make a simple LLM call to generate a random quote
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content("Tell me a random inspirational quote")
+        with _QUOTE_LOCK:
+            quote = _QUOTE_CACHE.get(_QUOTE_KEY)
+
+        if quote is None:
+            # Make a simple LLM call off the event loop to generate a random quote
+            model = get_model('gemini-2.5-flash')
+            response = await asyncio.to_thread(
+                model.generate_content, "Tell me a random inspirational quote"
+            )
+            quote = response.text
+            with _QUOTE_LOCK:
+                _QUOTE_CACHE[_QUOTE_KEY] = quote
         
         return {
             "success": True,
             "message": "Random quote generated successfully",
             "data": {
-                "quote": response.text,
+                "quote": quote,
             }
         }
     except Exception as e:
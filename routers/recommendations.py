@@ -1,22 +1,76 @@
-import json
+import asyncio
+import hashlib
 import logging
-import re
-import time
-from datetime import datetime, timedelta
+import threading
+from datetime import date, datetime, timedelta
 from typing import Optional, List
 
+import orjson
+from cachetools import TTLCache
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-import google.generativeai as genai
-
 from database.db import get_user_context
+from database.postgres import PoolExhaustedError
+from utils.gemini import get_genai, get_model, is_transient_error
 from utils.season import current_season
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/recommendations", tags=["recommendations"])
 
+# Structured-output schemas; Gemini is constrained to emit JSON matching
+# these, so replies parse directly without fence or comma cleanup
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+WEEKLY_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "day_name": {"type": "string"},
+            "date": {"type": "string"},
+            "occasion": {"type": "string"},
+            "recommendation": {"type": "string"},
+            "suggested_items": _STRING_LIST,
+            "tags": _STRING_LIST,
+        },
+        "required": ["day_name", "date", "occasion", "recommendation", "suggested_items", "tags"],
+    },
+}
+
+SEASONAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "advice": {"type": "string"},
+        "styling_tips": _STRING_LIST,
+        "outfit_suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "items": _STRING_LIST,
+                    "explanation": {"type": "string"},
+                },
+                "required": ["title", "items", "explanation"],
+            },
+        },
+    },
+    "required": ["advice", "styling_tips", "outfit_suggestions"],
+}
+
+_DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Replies longer than this are parsed in a worker thread
+_OFFLOAD_PARSE_THRESHOLD = 8192
+
+# Parsed seasonal responses keyed by a hash of the full prompt. The prompt
+# embeds the season and the user's wardrobe summary, so anonymous callers
+# share one entry per season and wardrobe edits produce a new key.
+_SEASONAL_CACHE = TTLCache(maxsize=256, ttl=3600)
+_SEASONAL_LOCK = threading.Lock()
+
 
 # -------------------------
 # Request / Response Models
@@ -40,91 +94,33 @@ class RecommendationResponse(BaseModel):
 # -------------------------
 # Helpers
 # -------------------------
-def _clean_response_text(text: str) -> str:
-    t = text.strip()
-    if t.startswith("```json"):
-        t = t[7:]
-    if t.startswith("```"):
-        t = t[3:]
-    if t.endswith("```"):
-        t = t[:-3]
-    return t.strip()
-
-
-def sanitize_json(raw: str) -> str:
-    """Best-effort cleanup if LLM returns JSON-like text."""
-    if not raw:
-        return raw
-
-    raw = re.sub(r"```(?:json)?\s*", "", raw)
-    raw = re.sub(r"\s*```", "", raw)
-
-    raw = raw.strip()
-
-    # normalize quotes
-    raw = raw.replace('"', '"').replace('"', '"')
-
-    # remove trailing commas
-    raw = re.sub(r",\s*(?=[}\]])", "", raw)
-
-    return raw
-
-def _extract_json_from_text(text: str):
-    """Extract and parse JSON from text, with fallback strategies."""
-    start = text.find("[")
-    end = text.rfind("]")
-    
-    if start == -1 or end == -1 or end <= start:
-        raise ValueError("No JSON array found in response")
-    
-    json_str = text[start : end + 1]
-    
-    # Try to parse directly
-    try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        logger.warning(f"Direct JSON parse failed: {e}, trying cleanup...")
-    
-    # Fallback: try removing problematic characters
-    try:
-        # Remove trailing commas before ] or }
-        json_str = re.sub(r",(\s*[}\]])", r"\1", json_str)
-        # Remove single quotes and replace with double quotes in specific contexts
-        # Try parsing again
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Unable to parse JSON after cleanup: {e}\nJSON text: {json_str[:200]}")
+def _parse_weekly(text: str) -> list:
+    """Parse a structured weekly reply into the list of day plans."""
+    data = orjson.loads(text)
+    if not isinstance(data, list):
+        raise ValueError("Weekly response JSON is not an array")
+    return data
 
-def build_weekly_prompt(user_context: dict, season: Optional[str] = None) -> str:
-    outfits = user_context.get("outfits", [])
-    favorites = user_context.get("favorites", [])
-    inferred = user_context.get("inferred_preferences", {})
 
-    brief_outfits = ""
-    if outfits:
-        brief_outfits = "\nUser outfits (most recent up to 8):\n"
-        for o in outfits[:8]:
-            name = o.get("name") or "Unnamed"
-            tags = ", ".join(o.get("tags") or [])
-            styles = ", ".join((o.get("analysis") or {}).get("styles") or [])
-            brief_outfits += f"- {name}: tags({tags}) styles({styles})\n"
+def _parse_seasonal(raw_text: str) -> dict:
+    """Parse a structured seasonal reply."""
+    data = orjson.loads(raw_text)
+    if not isinstance(data, dict):
+        raise ValueError("Seasonal response JSON is not an object")
+    return data
 
-    season_str = f"Season: {season}." if season else ""
 
-    prompt = f"""
-You are an expert fashion stylist creating a personalized 7-day outfit plan for a user.
+async def _parse_off_loop(parse, text: str):
+    """Run parse(text), in a worker thread when the reply is large enough to stall the loop."""
+    if len(text) > _OFFLOAD_PARSE_THRESHOLD:
+        return await asyncio.to_thread(parse, text)
+    return parse(text)
 
-CURRENT CONTEXT
-{season_str}
-Generate recommendations for the upcoming week (Monday to Sunday), starting from the current date.
 
-USER PROFILE
-Favorite items: {', '.join(favorites) if favorites else 'No favorites yet'}
-Style preferences: {', '.join(inferred.get('styles', [])) if inferred.get('styles') else 'Not specified'}
-Color palette: {', '.join(inferred.get('colors', [])) if inferred.get('colors') else 'Not specified'}
-
-AVAILABLE WARDROBE
-{brief_outfits if brief_outfits else 'User has no items uploaded yet. Suggest common, everyday clothing pieces.'}
+# Static stylist instructions go first and the per-user context last, so
+# every weekly request shares one stable prompt layout.
+STATIC_WEEKLY_INSTRUCTIONS = """
+You are an expert fashion stylist creating a personalized 7-day outfit plan for a user.
 
 OBJECTIVE
 Create a complete 7-day outfit plan that:
@@ -142,7 +138,7 @@ Return a JSON array containing EXACTLY 7 objects (one per day).
 
 Each object must follow this structure:
 
-{{
+{
   "day_name": "Monday",
   "date": "2024-02-12",
   "occasion": "Work/Casual",
@@ -154,7 +150,7 @@ Each object must follow this structure:
     "Leather loafers"
   ],
   "tags": ["minimal", "everyday", "structured"]
-}}
+}
 
 CRITICAL CONSTRAINTS
 - ALWAYS return exactly 7 days (Monday to Sunday)
@@ -170,12 +166,50 @@ STYLE GUIDELINES
 - No emojis, no exclamation marks
 - Neutral, adaptable language
 - Avoid repetitive phrasing
+"""
+
+
+def build_dynamic_context(user_context: dict, season: Optional[str] = None) -> str:
+    """Build the per-user part of the weekly prompt."""
+    outfits = user_context.get("outfits", [])
+    favorites = user_context.get("favorites", [])
+    inferred = user_context.get("inferred_preferences", {})
+
+    brief_outfits = ""
+    if outfits:
+        brief_outfits = "\nUser outfits (most recent up to 8):\n"
+        for o in outfits[:8]:
+            name = o.get("name") or "Unnamed"
+            tags = ", ".join(o.get("tags") or [])
+            styles = ", ".join(o.get("styles") or [])
+            brief_outfits += f"- {name}: tags({tags}) styles({styles})\n"
+
+    season_str = f"Season: {season}." if season else ""
+
+    return f"""
+CURRENT CONTEXT
+{season_str}
+Generate recommendations for the upcoming week (Monday to Sunday), starting from the current date.
+
+USER PROFILE
+Favorite items: {', '.join(favorites) if favorites else 'No favorites yet'}
+Style preferences: {', '.join(inferred.get('styles', [])) if inferred.get('styles') else 'Not specified'}
+Color palette: {', '.join(inferred.get('colors', [])) if inferred.get('colors') else 'Not specified'}
+
+AVAILABLE WARDROBE
+{brief_outfits if brief_outfits else 'User has no items uploaded yet. Suggest common, everyday clothing pieces.'}
 
 NOW GENERATE THE COMPLETE 7-DAY PLAN.
 Return ONLY the JSON array.
 """
 
-    return prompt
+
+def build_weekly_prompt(user_context: dict, season: Optional[str] = None) -> str:
+    return STATIC_WEEKLY_INSTRUCTIONS + build_dynamic_context(user_context, season)
+
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
 
 
 def fallback_response(season: str) -> dict:
@@ -211,34 +245,46 @@ async def weekly_recommendations(body: WeeklyRequest):
         raise HTTPException(status_code=400, detail="user_id is required")
 
     try:
-        context = get_user_context(body.user_id)
+        context = await asyncio.to_thread(get_user_context, body.user_id)
         prompt = build_weekly_prompt(context, season=body.season)
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
+        model = get_model("gemini-2.5-flash")
+        response = await asyncio.to_thread(
+            model.generate_content,
+            prompt,
+            generation_config=get_genai().types.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=WEEKLY_SCHEMA,
+            ),
+        )
 
         if not response or not getattr(response, "text", None):
             raise HTTPException(status_code=500, detail="LLM returned empty response")
 
-        text = _clean_response_text(response.text)
-        
         try:
-            suggestions = _extract_json_from_text(text)
+            suggestions = await _parse_off_loop(_parse_weekly, response.text)
         except ValueError as ve:
             logger.error(f"JSON extraction failed: {ve}")
             raise HTTPException(status_code=500, detail=f"Failed to parse LLM response: {str(ve)}")
 
         today = datetime.utcnow().date()
         for i, item in enumerate(suggestions):
-            if not item.get("date"):
-                item["date"] = (today + timedelta(days=i)).isoformat()
-            if not item.get("day_name"):
-                item["day_name"] = datetime.fromisoformat(item["date"]).strftime("%A")
+            if item.get("date"):
+                # Trust the LLM's day_name when it supplied a date; parse only if missing
+                if not item.get("day_name"):
+                    item["day_name"] = _DAY_NAMES[date.fromisoformat(item["date"]).weekday()]
+            else:
+                day = today + timedelta(days=i)
+                item["date"] = day.isoformat()
+                if not item.get("day_name"):
+                    item["day_name"] = _DAY_NAMES[day.weekday()]
 
         return {"success": True, "data": suggestions}
 
     except HTTPException:
         raise
+    except PoolExhaustedError:
+        raise
     except Exception as e:
         logger.exception("Failed to generate weekly recommendations: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -252,7 +298,7 @@ async def seasonal_recommendations(req: SeasonalRequest):
         # Optional user context
         user_ctx = {}
         if req.user_id:
-            user_ctx = get_user_context(req.user_id)
+            user_ctx = await asyncio.to_thread(get_user_context, req.user_id)
 
         # -------------------------
         # Prompt
@@ -260,8 +306,7 @@ async def seasonal_recommendations(req: SeasonalRequest):
         prompt = (
             f"You are a fashion stylist.\n"
             f"Current season: {season}\n\n"
-            "Give seasonal fashion advice, styling tips, and outfit ideas.\n"
-            "You may return plain text OR JSON.\n\n"
+            "Give seasonal fashion advice, styling tips, and outfit ideas.\n\n"
         )
 
         if user_ctx:
@@ -273,7 +318,7 @@ async def seasonal_recommendations(req: SeasonalRequest):
             prompt += "\n"
 
         prompt += (
-            "If you return JSON, use this format:\n"
+            "Respond with JSON in this format:\n"
             "{\n"
             '  "advice": "...",\n'
             '  "styling_tips": ["...", "..."],\n'
@@ -281,19 +326,30 @@ async def seasonal_recommendations(req: SeasonalRequest):
             "}\n"
         )
 
-        # Try models with retries
+        cache_key = _prompt_key(prompt)
+        with _SEASONAL_LOCK:
+            cached = _SEASONAL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Try models, retrying only transient errors
+        genai = get_genai()
+        generation_config = genai.types.GenerationConfig(
+            temperature=0.3,
+            max_output_tokens=1200,
+            response_mime_type="application/json",
+            response_schema=SEASONAL_SCHEMA,
+        )
         raw_text = None
         for model_name in ["gemini-2.5-flash"]:
             for attempt in range(1, 3):
                 try:
                     logger.info("LLM model=%s attempt=%d", model_name, attempt)
-                    model = genai.GenerativeModel(model_name)
-                    response = model.generate_content(
+                    model = get_model(model_name)
+                    response = await asyncio.to_thread(
+                        model.generate_content,
                         [prompt],
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.3,
-                            max_output_tokens=1200,
-                        ),
+                        generation_config=generation_config,
                     )
                     raw_text = (response.text or "").strip()
                     if raw_text:
@@ -301,8 +357,10 @@ async def seasonal_recommendations(req: SeasonalRequest):
                         break
                 except Exception as e:
                     logger.warning("LLM failed model=%s attempt=%d: %s", model_name, attempt, str(e))
+                    if not is_transient_error(e):
+                        break
                     if attempt < 2:
-                        time.sleep(2 ** (attempt - 1))
+                        await asyncio.sleep(2 ** (attempt - 1))
             if raw_text:
                 break
 
@@ -312,42 +370,28 @@ async def seasonal_recommendations(req: SeasonalRequest):
 
         # Try JSON parsing
         try:
-            # Remove code fences
-            cleaned = raw_text.strip()
-            if cleaned.startswith("`"):
-                nl_pos = cleaned.find("\n")
-                if nl_pos >= 0:
-                    cleaned = cleaned[nl_pos + 1 :]
-            if cleaned.endswith("`"):
-                cleaned = cleaned[:-3]
-            cleaned = cleaned.strip()
-
-            # Find JSON object
-            start_idx = cleaned.find("{")
-            end_idx = cleaned.rfind("}")
-
-            if start_idx < 0 or end_idx <= start_idx:
-                logger.warning("No JSON object found in response")
-                return fallback_response(season)
-
-            json_str = cleaned[start_idx : end_idx + 1]
-            json_str = sanitize_json(json_str)
-            data = json.loads(json_str)
-
-            return {
+            data = await _parse_off_loop(_parse_seasonal, raw_text)
+
+            result = {
                 "season": season,
                 "advice": data.get("advice", ""),
                 "styling_tips": data.get("styling_tips", []),
                 "outfit_suggestions": data.get("outfit_suggestions", []),
             }
+            # Only real LLM answers are cached; fallbacks are retried next time
+            with _SEASONAL_LOCK:
+                _SEASONAL_CACHE[cache_key] = result
+            return result
 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             logger.warning("JSON decode error: %s", str(e))
             return fallback_response(season)
         except Exception as e:
             logger.warning("JSON parsing error: %s", str(e))
             return fallback_response(season)
 
+    except PoolExhaustedError:
+        raise
     except Exception as e:
         logger.exception("Seasonal recommendation failed: %s", str(e))
         raise HTTPException(
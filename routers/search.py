@@ -1,12 +1,27 @@
+import hashlib
 import logging
-from pathlib import Path
-from fastapi import APIRouter, HTTPException, Query
+import threading
+from datetime import datetime
+from typing import Optional
 
-from database.postgres import execute_query
+import orjson
+from cachetools import TTLCache
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from database.postgres import execute_query, execute_query_one
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Upper bound on rows returned for a single search page
+SEARCH_LIMIT = 100
+
+# Serialized search responses and their ETags, keyed by the full request.
+# Entries are only reused while the ETag still matches, so writes are never
+# served stale.
+_SEARCH_CACHE = TTLCache(maxsize=1024, ttl=60)
+_SEARCH_LOCK = threading.Lock()
+
 
 def format_outfit(outfit_tuple: tuple) -> dict:
     """Format outfit response."""
@@ -15,25 +30,87 @@ def format_outfit(outfit_tuple: tuple) -> dict:
         "id": outfit_tuple[0],
         "image_url": image_url,
         "name": outfit_tuple[2],
-        "tags": [tag.strip() for tag in outfit_tuple[3].split(",")]
-        if outfit_tuple[3]
-        else [],
+        "tags": outfit_tuple[3] or [],
         "date": outfit_tuple[4],
         "analysis_results": outfit_tuple[5],
     }
 
 
+def _search_etag(
+    user_id: str, q: str, limit: int, before: Optional[datetime]
+) -> str:
+    """
+    ETag for a search page, derived from the user's outfit version rather
+    than from the results.
+
+    A trigger bumps the version on every insert, update or delete of the
+    user's outfits, so this is a single primary-key lookup.
+    """
+    row = execute_query_one(
+        "SELECT version FROM outfit_versions WHERE user_id = %s",
+        (user_id,)
+    )
+    version = row[0] if row else 0
+    key = repr((user_id, q, limit, before, version)).encode()
+    return '"%s"' % hashlib.blake2b(key, digest_size=8).hexdigest()
+
+
+def _search_response(
+    user_id: str, q: str, limit: int, before: Optional[datetime]
+) -> bytes:
+    """Run one page of a search and return the serialized JSON body."""
+    # Search in name and tags, newest first; `before` continues from a cursor
+    search_pattern = f"%{q}%"
+    keyset = "AND created_at < %s" if before else ""
+    params = (user_id, search_pattern, search_pattern)
+    if before:
+        params += (before,)
+    outfits = execute_query(
+        f"""
+        SELECT id, image_path, name, tags, created_at, analysis_results::text
+        FROM outfits
+        WHERE user_id = %s AND (
+            name ILIKE %s OR
+            tags_text ILIKE %s
+        ) {keyset}
+        ORDER BY created_at DESC
+        LIMIT %s
+        """,
+        params + (limit,),
+        fetch=True
+    ) or []
+    
+    body = orjson.dumps({
+        "success": True,
+        "query": q,
+        "count": len(outfits),
+        "data": [format_outfit(outfit) for outfit in outfits],
+        "next_cursor": outfits[-1][4] if len(outfits) == limit else None,
+    })
+    return body
+
+
 @router.get("/api/search")
-async def search_outfits_endpoint(user_id: str = Query(...), q: str = Query(...)):
+def search_outfits_endpoint(
+    request: Request,
+    user_id: str = Query(...),
+    q: str = Query(...),
+    limit: int = Query(50, ge=1, le=SEARCH_LIMIT),
+    cursor: Optional[datetime] = None,
+):
     """
     Search for outfits by query text.
     
     Query Parameters:
     - user_id: The ID of the user (required)
     - q: The search query text (required)
+    - limit: Page size (default 50, max 100)
+    - cursor: `next_cursor` from the previous page
     
     Returns:
-    - Matching outfits with metadata
+    - A page of matching outfits with metadata and `next_cursor` (null on
+      the last page), with an ETag; a matching If-None-Match gets an
+      empty 304 instead
     """
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
@@ -41,22 +118,19 @@ async def search_outfits_endpoint(user_id: str = Query(...), q: str = Query(...)
     if not q.strip():
         raise HTTPException(status_code=400, detail="q (search query) is required")
     
-    # Search in name and tags
-    search_pattern = f"%{q}%"
-    outfits = execute_query(
-        """
-        SELECT id, image_path, name, tags, created_at, analysis_results
-        FROM outfits
-        WHERE user_id = %s AND (name ILIKE %s OR tags ILIKE %s)
-        ORDER BY created_at DESC
-        """,
-        (user_id, search_pattern, search_pattern),
-        fetch=True
-    )
-    
-    return {
-        "success": True,
-        "query": q,
-        "count": len(outfits) if outfits else 0,
-        "data": [format_outfit(outfit) for outfit in outfits] if outfits else [],
-    }
+    # Answer revalidations before running the search itself
+    etag = _search_etag(user_id, q, limit, cursor)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    key = (user_id, q, limit, cursor)
+    with _SEARCH_LOCK:
+        cached = _SEARCH_CACHE.get(key)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
+    else:
+        body = _search_response(user_id, q, limit, cursor)
+        with _SEARCH_LOCK:
+            _SEARCH_CACHE[key] = (etag, body)
+
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
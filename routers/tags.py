@@ -1,8 +1,9 @@
+import re
 import logging
 from fastapi import APIRouter, HTTPException, Body
 
-from database.db import get_outfit_tags, save_outfit_tags
-from database.postgres import execute_query_one
+from database.db import get_outfit_tags_if_owner, save_outfit_tags
+from utils.ids import is_valid_outfit_id
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -11,6 +12,9 @@ logger = logging.getLogger(__name__)
 MAX_TAG_LENGTH = 30
 MAX_TAGS_PER_OUTFIT = 15
 
+# Letters and digits (any script, like str.isalnum), spaces and hyphens
+_TAG_RE = re.compile(r"(?:[^\W_]|[ -])+")
+
 
 def validate_tag(tag: str) -> str:
     """Validate and normalize a tag."""
@@ -25,50 +29,35 @@ def validate_tag(tag: str) -> str:
         raise HTTPException(status_code=400, detail=f"Tag must be {MAX_TAG_LENGTH} characters or less")
     
     # Only alphanumeric, spaces, and hyphens
-    if not all(c.isalnum() or c in ' -' for c in tag):
+    if not _TAG_RE.fullmatch(tag):
         raise HTTPException(status_code=400, detail="Tag can only contain letters, numbers, spaces, and hyphens")
     
     return tag
 
 
-def verify_outfit_ownership(outfit_id: str, user_id: str) -> bool:
-    """Verify that a user owns an outfit."""
-    try:
-        result = execute_query_one(
-            "SELECT user_id FROM outfits WHERE id = %s",
-            (outfit_id,)
-        )
-        if not result:
-            return False
-        return result[0] == user_id
-    except Exception:
-        logger.exception("Error verifying outfit ownership")
-        return False
-
-
 @router.get("/api/outfits/{outfit_id}/tags")
-async def get_tags(outfit_id: str, user_id: str):
+def get_tags(outfit_id: str, user_id: str):
     """Get all tags for an outfit. Query param: user_id"""
     
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
     
-    # Verify ownership
-    if not verify_outfit_ownership(outfit_id, user_id):
+    # Fetch tags, verifying ownership in the same query
+    tags = get_outfit_tags_if_owner(outfit_id, user_id)
+    if tags is None:
         raise HTTPException(status_code=403, detail="You do not have permission to view this outfit")
     
-    tags = get_outfit_tags(outfit_id)
     return {"success": True, "data": sorted(tags)}
 
 
 @router.post("/api/outfits/{outfit_id}/tags")
-async def add_tag(outfit_id: str, user_id: str, payload: dict = Body(...)):
+def add_tag(outfit_id: str, user_id: str, payload: dict = Body(...)):
     """Add a tag to an outfit. Query param: user_id. Body: {\"tag\": \"Casual\"}"""
     
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
     
@@ -79,13 +68,11 @@ async def add_tag(outfit_id: str, user_id: str, payload: dict = Body(...)):
     # Validate and normalize
     tag = validate_tag(tag)
     
-    # Verify ownership
-    if not verify_outfit_ownership(outfit_id, user_id):
+    # Get existing tags, verifying ownership in the same query
+    existing = get_outfit_tags_if_owner(outfit_id, user_id)
+    if existing is None:
         raise HTTPException(status_code=403, detail="You do not have permission to modify this outfit")
     
-    # Get existing tags
-    existing = get_outfit_tags(outfit_id)
-    
     # Check for duplicate
     if tag in existing:
         raise HTTPException(status_code=409, detail="Tag already exists")
@@ -99,18 +86,18 @@ async def add_tag(outfit_id: str, user_id: str, payload: dict = Body(...)):
     
     # Add and save
     updated = existing + [tag]
-    if not save_outfit_tags(outfit_id, updated):
+    if not save_outfit_tags(outfit_id, user_id, updated):
         raise HTTPException(status_code=500, detail="Failed to save tag")
     
     return {"success": True, "data": sorted(updated)}
 
 
 @router.delete("/api/outfits/{outfit_id}/tags/{tag}")
-async def remove_tag(outfit_id: str, user_id: str, tag: str):
+def remove_tag(outfit_id: str, user_id: str, tag: str):
     """Remove a tag from an outfit. Query param: user_id. Path param: tag"""
     
-    if not outfit_id.strip():
-        raise HTTPException(status_code=400, detail="outfit_id is required")
+    if not is_valid_outfit_id(outfit_id):
+        raise HTTPException(status_code=400, detail="A valid outfit_id is required")
     if not user_id.strip():
         raise HTTPException(status_code=400, detail="user_id is required")
     if not tag.strip():
@@ -119,13 +106,11 @@ async def remove_tag(outfit_id: str, user_id: str, tag: str):
     # Normalize the tag for comparison
     tag_normalized = tag.strip().lower()
     
-    # Verify ownership
-    if not verify_outfit_ownership(outfit_id, user_id):
+    # Get existing tags, verifying ownership in the same query
+    existing = get_outfit_tags_if_owner(outfit_id, user_id)
+    if existing is None:
         raise HTTPException(status_code=403, detail="You do not have permission to modify this outfit")
     
-    # Get existing tags
-    existing = get_outfit_tags(outfit_id)
-    
     # Remove tag
     updated = [t for t in existing if t != tag_normalized]
     
@@ -133,7 +118,7 @@ async def remove_tag(outfit_id: str, user_id: str, tag: str):
         raise HTTPException(status_code=404, detail="Tag not found on this outfit")
     
     # Save
-    if not save_outfit_tags(outfit_id, updated):
+    if not save_outfit_tags(outfit_id, user_id, updated):
         raise HTTPException(status_code=500, detail="Failed to remove tag")
     
     return {"success": True, "data": sorted(updated)}
@@ -1,126 +1,113 @@
+import re
+import hashlib
 import uuid
+import asyncio
 import logging
 import io
-from pathlib import Path
-from datetime import datetime
+import os
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
 
-from utils.llm import analyze_outfit_image
+from utils.tasks import dispatch_analysis
 from utils.cloudinary_upload import upload_image_to_cloudinary
-from database.postgres import execute_query
+from utils.image import compress_image, sniff_image_type
+from database.db import find_outfit_by_content_hash
+from database.postgres import PoolExhaustedError
+from database.writer import insert_outfit
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-    logger.warning("Pillow not installed - image compression disabled")
-
 # Constants
-ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+ALLOWED_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp"})
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-MAX_IMAGE_DIMENSION = 2048  # Resize if larger
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Read uploads in 64KB chunks
+
+# Splits a comma-separated tag string, swallowing whitespace around commas
+_split_tags = re.compile(r"\s*,\s*").split
 
 
 # =========================
 # Helpers
 # =========================
-def compress_image(file_content: bytes, filename: str, max_size_kb: int = 500) -> bytes:
-    """
-    Compress image to optimize upload speed.
-    Reduces file size while maintaining quality.
-    """
-    if not PIL_AVAILABLE:
-        logger.warning("Pillow not available - skipping compression")
-        return file_content
-    
-    try:
-        # Check current size
-        current_size_kb = len(file_content) / 1024
-        if current_size_kb <= max_size_kb:
-            logger.debug(f"Image already optimized: {current_size_kb:.1f}KB")
-            return file_content
-        
-        logger.info(f"Compressing image from {current_size_kb:.1f}KB...")
-        
-        # Load image
-        img = Image.open(io.BytesIO(file_content))
-        
-        # Convert RGBA to RGB if necessary (for JPEG compatibility)
-        if img.mode in ("RGBA", "LA", "P"):
-            rgb_img = Image.new("RGB", img.size, (255, 255, 255))
-            rgb_img.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
-            img = rgb_img
-        
-        # Resize if too large
-        img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
-        
-        # Compress and save to bytes
-        output = io.BytesIO()
-        quality = 85
-        while quality > 40:
-            output.seek(0)
-            output.truncate(0)
-            img.save(output, format="JPEG", quality=quality, optimize=True)
-            if len(output.getvalue()) / 1024 <= max_size_kb:
-                break
-            quality -= 5
-        
-        compressed = output.getvalue()
-        new_size_kb = len(compressed) / 1024
-        logger.info(f"Image compressed: {current_size_kb:.1f}KB → {new_size_kb:.1f}KB ({(100 * (current_size_kb - new_size_kb) / current_size_kb):.0f}% reduction)")
-        return compressed
-        
-    except Exception as e:
-        logger.warning(f"Image compression failed: {e} - using original")
-        return file_content
-
-
-def validate_file(file, file_content):
-    """Validate uploaded file type and size."""
-    file_ext = Path(file.filename).suffix.lower()
+def validate_file(file):
+    """Validate uploaded file type from its extension."""
+    file_ext = os.path.splitext(file.filename)[1].lower()
 
     if file_ext not in ALLOWED_EXTENSIONS:
-        return False, f"Invalid file type. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-
-    file_size = len(file_content)
-
-    if file_size > MAX_FILE_SIZE:
-        return False, "File size exceeds 10MB limit"
-
-    if file_size < 1024:
-        return False, "File size too small. Minimum size: 1KB"
+        return False, f"Invalid file type. Allowed types: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
 
     return True, ""
 
 
-def save_outfit_to_db(
+def content_hash(user_id: str, content: bytes) -> str:
+    """Hash upload bytes per user; doubles as the Cloudinary public_id."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(user_id.encode())
+    h.update(b"\0")
+    h.update(content)
+    return h.hexdigest()
+
+
+def existing_outfit_response(row: tuple) -> dict:
+    """Upload response for an image the user has already uploaded."""
+    outfit_id, image_url, name, tags, analysis_status = row
+    return {
+        "success": True,
+        "duplicate": True,
+        "data": {
+            "id": outfit_id,
+            "image_url": image_url,
+            "name": name,
+            "tags": tags or [],
+            "analysis_status": analysis_status,
+        },
+    }
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Read an upload in chunks, validating as it goes.
+
+    The image signature is checked on the first chunk and reading stops as
+    soon as the size limit is crossed, so bad uploads are rejected without
+    buffering the whole body.
+    """
+    # Multipart parsing already knows the part size; reject oversize files
+    # before reading any of them
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+
+    buffer = io.BytesIO()
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if size == 0 and sniff_image_type(chunk[:12]) is None:
+            raise HTTPException(status_code=400, detail="File content is not a supported image")
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+        buffer.write(chunk)
+
+    if size < 1024:
+        raise HTTPException(status_code=400, detail="File size too small. Minimum size: 1KB")
+
+    return buffer.getvalue()
+
+
+async def save_outfit_to_db(
     outfit_id: str,
     user_id: str,
     image_url: str,
     image_filename: str,
     name: str,
-    tags: str,
-    cloudinary_public_id: str
+    tags: list,
+    cloudinary_public_id: str,
+    image_hash: str,
 ) -> None:
-    """Save outfit metadata to database."""
-    execute_query(
-        """
-        INSERT INTO outfits (
-            id,
-            user_id,
-            image_path,
-            image_filename,
-            name,
-            tags,
-            created_at,
-            analysis_status
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """,
+    """Save outfit metadata to database, batched with concurrent uploads."""
+    await insert_outfit(
         (
             outfit_id,
             user_id,
@@ -128,8 +115,8 @@ def save_outfit_to_db(
             cloudinary_public_id,  # Store public_id for deletion
             name,
             tags,
-            datetime.utcnow(),
             "pending",
+            image_hash,
         ),
     )
 
@@ -156,18 +143,32 @@ async def upload_outfit(
 
         logger.info(f"Starting upload for user {user_id}, file: {file.filename}")
 
-        file_content = await file.read()
-        is_valid, error_msg = validate_file(file, file_content)
+        is_valid, error_msg = validate_file(file)
         if not is_valid:
             raise HTTPException(status_code=400, detail=error_msg)
+
+        file_content = await read_upload(file)
+
+        # Same bytes from the same user: return the existing outfit without
+        # compressing or uploading again
+        image_hash = content_hash(user_id, file_content)
+        existing = await asyncio.to_thread(find_outfit_by_content_hash, user_id, image_hash)
+        if existing:
+            outfit_id, image_url, *_, analysis_status = existing
+            logger.info("Upload matches existing outfit %s, skipping", outfit_id)
+            # Re-uploading is how a user retries an analysis that failed
+            if analysis_status == "failed":
+                dispatch_analysis(background_tasks, image_url, outfit_id)
+                existing = (*existing[:4], "pending")
+            return existing_outfit_response(existing)
         
-        # Compress image to optimize upload speed
+        # Compress image to optimize upload speed (CPU-bound, off the event loop)
         logger.info("Compressing image...")
-        compressed_content = compress_image(file_content, file.filename)
+        compressed_content = await asyncio.to_thread(compress_image, file_content, file.filename)
         
-        # Upload to Cloudinary with optimizations
+        # Upload to Cloudinary with optimizations (network-bound, off the event loop)
         logger.info("Uploading to Cloudinary...")
-        result = upload_image_to_cloudinary(compressed_content, file.filename)
+        result = await asyncio.to_thread(upload_image_to_cloudinary, compressed_content, file.filename, image_hash)
         if not result:
             raise HTTPException(status_code=500, detail="Failed to upload image to cloud storage")
 
@@ -179,26 +180,32 @@ async def upload_outfit(
 
         # Generate outfit ID
         outfit_id = str(uuid.uuid4())
+        tag_list = [t for t in _split_tags(tags.strip()) if t]
 
         try:
             # Save to database (Cloudinary URL stored as image_path)
             logger.info(f"Saving outfit {outfit_id} to database...")
-            save_outfit_to_db(
+            await save_outfit_to_db(
                 outfit_id=outfit_id,
                 user_id=user_id,
                 image_url=image_url,
                 image_filename=cloudinary_public_id,
                 name=name or file.filename,
-                tags=tags,
+                tags=tag_list,
                 cloudinary_public_id=cloudinary_public_id,
+                image_hash=image_hash,
             )
             logger.info(f"Outfit {outfit_id} saved to database")
         except Exception:
+            # A concurrent upload of the same image may have won the unique index
+            existing = await asyncio.to_thread(find_outfit_by_content_hash, user_id, image_hash)
+            if existing:
+                return existing_outfit_response(existing)
             logger.exception("Failed to save outfit %s to database", outfit_id)
             raise HTTPException(status_code=500, detail="Failed to save outfit metadata")
 
         # Run AI analysis in background (non-blocking)
-        background_tasks.add_task(analyze_outfit_image, image_url, outfit_id)
+        dispatch_analysis(background_tasks, image_url, outfit_id)
 
         logger.info(f"Upload completed for outfit {outfit_id}")
         return {
@@ -207,13 +214,15 @@ async def upload_outfit(
                 "id": outfit_id,
                 "image_url": image_url,
                 "name": name or file.filename,
-                "tags": [t.strip() for t in tags.split(",") if t.strip()],
+                "tags": tag_list,
                 "analysis_status": "pending",
             },
         }
     
     except HTTPException:
         raise
+    except PoolExhaustedError:
+        raise
     except Exception as e:
         logger.exception(f"Unexpected error in upload_outfit: {str(e)}")
         raise HTTPException(
@@ -3,9 +3,11 @@ Cloudinary image upload utility
 Handles uploading images to Cloudinary cloud storage
 """
 
+import io
 import os
 import logging
 import time
+from typing import Optional
 import cloudinary
 import cloudinary.uploader
 
@@ -19,14 +21,19 @@ cloudinary.config(
     secure_cdn_url=True,
 )
 
+# Inputs above this size are sent with the chunked upload_large API
+LARGE_UPLOAD_THRESHOLD = 5 * 1024 * 1024  # 5MB
+LARGE_UPLOAD_CHUNK_SIZE = 6_000_000  # Cloudinary requires chunks of at least 5MB
 
-def upload_image_to_cloudinary(file_content: bytes, filename: str) -> dict:
+
+def upload_image_to_cloudinary(file_content: bytes, filename: str, public_id: Optional[str] = None) -> dict:
     """
     Upload image to Cloudinary with optimization.
     
     Args:
         file_content: Image file bytes
         filename: Original filename
+        public_id: Deterministic public ID; defaults to the filename stem
         
     Returns:
         Dict with 'url' and 'public_id' keys
@@ -35,12 +42,10 @@ def upload_image_to_cloudinary(file_content: bytes, filename: str) -> dict:
         start_time = time.time()
         logger.info(f"Starting Cloudinary upload for {filename} ({len(file_content) / 1024:.1f}KB)...")
         
-        # Upload to Cloudinary with optimizations
-        result = cloudinary.uploader.upload(
-            file_content,
-            resource_type="auto",
+        options = dict(
+            resource_type="image",
             folder="outfit-images",
-            public_id=filename.split('.')[0],  # Remove extension
+            public_id=public_id or filename.split('.')[0],  # Remove extension
             overwrite=False,
             tags=["outfit", "fashion"],
             use_filename=True,
@@ -53,8 +58,18 @@ def upload_image_to_cloudinary(file_content: bytes, filename: str) -> dict:
                 {"width": 500, "height": 500, "crop": "thumb", "gravity": "face"},
                 {"width": 200, "height": 200, "crop": "thumb", "gravity": "face"},
             ],
-            eager_async=False,  # Wait for thumbnails (faster client response overall)
+            eager_async=True,  # Build thumbnails in the background; not on the response path
         )
+
+        # Upload to Cloudinary with optimizations; oversize inputs go in chunks
+        if len(file_content) > LARGE_UPLOAD_THRESHOLD:
+            result = cloudinary.uploader.upload_large(
+                io.BytesIO(file_content),
+                chunk_size=LARGE_UPLOAD_CHUNK_SIZE,
+                **options,
+            )
+        else:
+            result = cloudinary.uploader.upload(file_content, **options)
         
         upload_time = time.time() - start_time
         logger.info(f"Cloudinary upload completed in {upload_time:.2f}s - URL: {result.get('secure_url')}")
@@ -0,0 +1,39 @@
+"""
+Lazy Google Generative AI client
+Defers importing and configuring the Gemini SDK until an endpoint needs it
+"""
+
+import os
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_genai():
+    """Import and configure google.generativeai on first use."""
+    import google.generativeai as genai
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY not set. Please add it to your .env file.")
+
+    genai.configure(api_key=api_key)
+    logger.info("Configured Google Generative AI client")
+    return genai
+
+
+@lru_cache(maxsize=8)
+def get_model(model_name: str):
+    """Return a shared GenerativeModel instance for the given model name."""
+    return get_genai().GenerativeModel(model_name)
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """Return True for Gemini errors worth retrying (overload, timeouts, rate limits)."""
+    from google.api_core import exceptions as gexc
+
+    return isinstance(
+        exc, (gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.ResourceExhausted)
+    )
@@ -0,0 +1,11 @@
+import re
+
+# Outfit ids are generated with uuid.uuid4() at upload time
+_UUID_RE = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+)
+
+
+def is_valid_outfit_id(outfit_id: str) -> bool:
+    """Return True if outfit_id is a canonical UUID string."""
+    return bool(outfit_id) and _UUID_RE.fullmatch(outfit_id) is not None
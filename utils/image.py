@@ -0,0 +1,120 @@
+"""
+Image helpers for uploads
+Pillow is optional; without it images are passed through uncompressed
+"""
+
+import io
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, features
+    PIL_AVAILABLE = True
+    # Pillow wheels bundle libwebp, but source builds may lack it
+    WEBP_AVAILABLE = features.check("webp")
+except ImportError:
+    PIL_AVAILABLE = False
+    WEBP_AVAILABLE = False
+    logger.warning("Pillow not installed - image compression disabled")
+
+MAX_IMAGE_DIMENSION = 2048  # Resize if larger
+
+
+# Leading-byte signatures of accepted image formats
+_MAGIC = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Return the image format named by the leading bytes, or None if unsupported."""
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    # WebP is a RIFF container with the format tag at bytes 8-12
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _encode_jpeg(img, quality: int) -> bytes:
+    """Encode an image to JPEG in a single pass (EXIF is not carried over)."""
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality, optimize=False, progressive=True)
+    return output.getvalue()
+
+
+def _encode_webp(img, quality: int) -> bytes:
+    """Encode an image to lossy WebP, typically well under the JPEG size."""
+    output = io.BytesIO()
+    img.save(output, format="WEBP", quality=quality, method=4)
+    return output.getvalue()
+
+
+# Compressed uploads are WebP where the encoder is available
+_encode = _encode_webp if WEBP_AVAILABLE else _encode_jpeg
+
+
+def compress_image(file_content: bytes, filename: str, max_size_kb: int = 500) -> bytes:
+    """
+    Compress image to optimize upload speed.
+    Reduces file size while maintaining quality; output is WebP when
+    supported, JPEG otherwise.
+    """
+    if not PIL_AVAILABLE:
+        logger.warning("Pillow not available - skipping compression")
+        return file_content
+    
+    try:
+        # Check current size
+        current_size_kb = len(file_content) / 1024
+        if current_size_kb <= max_size_kb:
+            logger.debug(f"Image already optimized: {current_size_kb:.1f}KB")
+            return file_content
+        
+        logger.info(f"Compressing image from {current_size_kb:.1f}KB...")
+        
+        # Load image
+        img = Image.open(io.BytesIO(file_content))
+        
+        # Let libjpeg-turbo downscale by 1/2, 1/4 or 1/8 during decode so
+        # large photos are never fully decoded just to be shrunk
+        if img.format == "JPEG":
+            img.draft(img.mode, (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+        
+        # Flatten transparency onto white (WebP could keep alpha, but the
+        # JPEG fallback cannot, so both encoders see the same RGB image)
+        if img.mode in ("RGBA", "LA", "P"):
+            rgb_img = Image.new("RGB", img.size, (255, 255, 255))
+            rgb_img.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
+            img = rgb_img
+        
+        # Resize if too large
+        img.thumbnail(
+            (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION),
+            Image.Resampling.LANCZOS,
+            reducing_gap=3.0,
+        )
+        
+        # Encode once at a quality estimated from the size ratio; if that
+        # misses the target, step halfway toward the floor at most twice
+        quality = max(40, min(80, int(80 * max_size_kb / current_size_kb) + 10))
+        compressed = _encode(img, quality)
+        for _ in range(2):
+            if len(compressed) / 1024 <= max_size_kb or quality <= 40:
+                break
+            quality = (40 + quality) // 2
+            compressed = _encode(img, quality)
+        
+        new_size_kb = len(compressed) / 1024
+        logger.info(f"Image compressed: {current_size_kb:.1f}KB → {new_size_kb:.1f}KB ({(100 * (current_size_kb - new_size_kb) / current_size_kb):.0f}% reduction)")
+        return compressed
+        
+    except Exception as e:
+        logger.warning(f"Image compression failed: {e} - using original")
+        return file_content
@@ -1,17 +1,25 @@
-import json
-import base64
 import logging
 from pathlib import Path
+from functools import lru_cache
 from typing import List
-from urllib import request as urllib_request
-from urllib.error import URLError
 
-import google.generativeai as genai
+import orjson
+import urllib3
 
 from database.db import update_analysis_status
+from database.postgres import background_checkouts
+from utils.gemini import get_genai, get_model
 
 logger = logging.getLogger(__name__)
 
+# Shared keep-alive pool for downloading images from Cloudinary's CDN
+_HTTP = urllib3.PoolManager(
+    maxsize=16,
+    timeout=urllib3.Timeout(connect=5.0, read=15.0),
+    retries=urllib3.Retry(total=2, backoff_factor=0.2),
+    headers={"Accept": "image/*"},
+)
+
 # -------------------------------------------------
 # Color name → hex mapping
 # -------------------------------------------------
@@ -53,23 +61,54 @@ COLOR_NAME_MAP = {
     "lavender": "#E6E6FA",
     "charcoal": "#36454F",
 }
+DEFAULT_COLOR_HEX = "#9CA3AF"  # fallback gray
 
 
 def convert_color_names_to_hex(colors: List[str]) -> List[str]:
     """Convert color names from LLM output to hex codes."""
-    result = []
+    return [
+        c if c.startswith("#") and len(c) == 7 else COLOR_NAME_MAP.get(c, DEFAULT_COLOR_HEX)
+        for c in (color.strip().lower() for color in colors or [])
+    ]
+
+
+# MIME types for local image files, by lowercase extension
+MIME_BY_EXT = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
 
-    for color in colors or []:
-        c = color.strip().lower()
 
-        if c.startswith("#") and len(c) == 7:
-            result.append(c)
-        elif c in COLOR_NAME_MAP:
-            result.append(COLOR_NAME_MAP[c])
-        else:
-            result.append("#9CA3AF")  # fallback gray
+# -------------------------------------------------
+# Gemini model, prompt and generation config
+# -------------------------------------------------
+ANALYSIS_MODEL = "gemini-2.5-flash"
 
-    return result
+ANALYSIS_PROMPT = """Analyze this outfit image and return ONLY a valid JSON object with this exact structure:
+{
+  "description": "2-3 sentences about the outfit style",
+  "clothing_items": ["specific items visible"],
+  "colors": ["hex or color names"],
+  "patterns": ["solid", "striped"],
+  "styles": ["casual", "formal", "streetwear"],
+  "occasions": ["weekend", "work", "casual"],
+  "fit_analysis": "description of how clothes fit",
+  "color_theory": "explanation of color harmony",
+  "recommendations": ["styling tip 1", "styling tip 2", "styling tip 3"]
+}"""
+
+
+@lru_cache(maxsize=1)
+def _analysis_config():
+    """Build the analysis GenerationConfig once, on first use."""
+    return get_genai().types.GenerationConfig(
+        temperature=0.3,
+        max_output_tokens=2000,
+        response_mime_type="application/json",
+    )
 
 
 # -------------------------------------------------
@@ -81,65 +120,54 @@ def analyze_outfit_image(image_path: str, outfit_id: str) -> None:
     Supports both local file paths and URLs (e.g., Cloudinary URLs).
     This function MUST NEVER crash the app.
     """
+    # Runs as a background task or Celery job: wait for a pooled connection
+    # rather than failing fast like request handlers do
+    with background_checkouts():
+        _run_analysis(image_path, outfit_id)
 
+
+def _run_analysis(image_path: str, outfit_id: str) -> None:
+    """Download, analyze and store results for one outfit image."""
     logger.info("Starting analysis for outfit %s", outfit_id)
+    update_analysis_status(outfit_id, "processing")
 
     try:
         # Determine if it's a URL or file path
         if image_path.startswith("http://") or image_path.startswith("https://"):
             # Download image from URL
             try:
-                with urllib_request.urlopen(image_path) as response:
-                    image_data = base64.b64encode(response.read()).decode("utf-8")
+                response = _HTTP.request("GET", image_path)
+                if response.status >= 400:
+                    raise urllib3.exceptions.HTTPError(f"HTTP {response.status}")
+                image_data = response.data
                 # Detect MIME type from content-type header
                 content_type = response.headers.get("Content-Type", "image/jpeg")
                 mime_type = content_type.split(";")[0].strip()
-            except URLError as e:
+            except urllib3.exceptions.HTTPError as e:
                 logger.error("Failed to download image from URL %s: %s", image_path, e)
-                update_analysis_status(outfit_id, "failed", json.dumps({"error": f"Failed to download image: {str(e)}"}))
+                update_analysis_status(outfit_id, "failed", {"error": f"Failed to download image: {str(e)}"})
                 return
         else:
             # Read local file
             try:
                 with open(image_path, "rb") as img:
-                    image_data = base64.b64encode(img.read()).decode("utf-8")
+                    image_data = img.read()
             except FileNotFoundError:
                 logger.error("Image file not found: %s", image_path)
-                update_analysis_status(outfit_id, "failed", json.dumps({"error": "Image file not found"}))
+                update_analysis_status(outfit_id, "failed", {"error": "Image file not found"})
                 return
             
             ext = Path(image_path).suffix.lower()
-            mime_type = {
-                ".jpg": "image/jpeg",
-                ".jpeg": "image/jpeg",
-                ".png": "image/png",
-                ".webp": "image/webp",
-            }.get(ext, "image/jpeg")
-
-        model = genai.GenerativeModel("gemini-2.5-flash")
+            mime_type = MIME_BY_EXT.get(ext, "image/jpeg")
 
-        prompt = """Analyze this outfit image and return ONLY a valid JSON object with this exact structure:
-{
-  "description": "2-3 sentences about the outfit style",
-  "clothing_items": ["specific items visible"],
-  "colors": ["hex or color names"],
-  "patterns": ["solid", "striped"],
-  "styles": ["casual", "formal", "streetwear"],
-  "occasions": ["weekend", "work", "casual"],
-  "fit_analysis": "description of how clothes fit",
-  "color_theory": "explanation of color harmony",
-  "recommendations": ["styling tip 1", "styling tip 2", "styling tip 3"]
-}"""
+        model = get_model(ANALYSIS_MODEL)
 
         response = model.generate_content(
             [
-                prompt,
+                ANALYSIS_PROMPT,
                 {"mime_type": mime_type, "data": image_data},
             ],
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.3,
-                max_output_tokens=2000,
-            ),
+            generation_config=_analysis_config(),
         )
 
         raw_text = (response.text or "").strip()
@@ -147,14 +175,10 @@ def analyze_outfit_image(image_path: str, outfit_id: str) -> None:
         if not raw_text:
             raise ValueError("Empty response from Gemini")
 
-        # Try to extract JSON object safely
-        json_start = raw_text.find("{")
-        json_end = raw_text.rfind("}")  
-        if json_start == -1 or json_end == -1 or json_end <= json_start:
-            logger.error(f"No JSON object found in response: {raw_text[:500]}")
-            raise ValueError(f"No JSON object found in response: {raw_text[:200]}")
-        json_str = raw_text[json_start: json_end + 1]
-        analysis = json.loads(json_str)
+        # JSON mode returns a bare object, so parse it directly
+        analysis = orjson.loads(raw_text)
+        if not isinstance(analysis, dict):
+            raise ValueError(f"Expected a JSON object in response: {raw_text[:200]}")
 
         # Normalize colors
         if isinstance(analysis.get("colors"), list):
@@ -163,7 +187,7 @@ def analyze_outfit_image(image_path: str, outfit_id: str) -> None:
         update_analysis_status(outfit_id, "completed", analysis)
         logger.info("Analysis completed for outfit %s", outfit_id)
 
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"JSON parsing failed for outfit {outfit_id}: {str(e)}")
         logger.error(f"Raw response was: {raw_text[:500] if 'raw_text' in locals() else 'N/A'}")
         update_analysis_status(outfit_id, "failed")
@@ -2,6 +2,23 @@ from datetime import date
 from typing import Optional
 
 
+def _season_for(month: int, day: int) -> str:
+    md = (month, day)
+    if (3, 20) <= md < (6, 21):
+        return "spring"
+    if (6, 21) <= md < (9, 22):
+        return "summer"
+    if (9, 22) <= md < (12, 21):
+        return "fall"
+    # winter spans year boundary
+    return "winter"
+
+
+# Season for every calendar day, indexed by month * 32 + day. Keying on
+# (month, day) rather than day-of-year keeps the boundaries fixed in leap years.
+_SEASON_BY_DAY = tuple(_season_for(i // 32, i % 32) for i in range(13 * 32))
+
+
 def current_season(today: Optional[date] = None) -> str:
     """Return current season name: spring, summer, fall, winter.
 
@@ -13,19 +30,4 @@ def current_season(today: Optional[date] = None) -> str:
     """
     if today is None:
         today = date.today()
-
-    y = today.year
-    # Define season start dates
-    spring_start = date(y, 3, 20)
-    summer_start = date(y, 6, 21)
-    fall_start = date(y, 9, 22)
-    winter_start = date(y, 12, 21)
-
-    if spring_start <= today < summer_start:
-        return "spring"
-    if summer_start <= today < fall_start:
-        return "summer"
-    if fall_start <= today < winter_start:
-        return "fall"
-    # winter spans year boundary
-    return "winter"
+    return _SEASON_BY_DAY[today.month * 32 + today.day]
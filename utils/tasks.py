@@ -0,0 +1,44 @@
+"""
+Outfit analysis dispatch
+Runs analysis on a Celery worker pool when CELERY_BROKER_URL is set and
+Celery is installed; otherwise falls back to FastAPI BackgroundTasks
+"""
+
+import os
+import logging
+from fastapi import BackgroundTasks
+
+from utils.llm import analyze_outfit_image
+
+logger = logging.getLogger(__name__)
+
+try:
+    from celery import Celery
+    CELERY_AVAILABLE = True
+except ImportError:
+    CELERY_AVAILABLE = False
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
+
+celery_app = None
+analyze_outfit_task = None
+
+if CELERY_AVAILABLE and CELERY_BROKER_URL:
+    celery_app = Celery("psi_backend", broker=CELERY_BROKER_URL)
+    # Ack after the task finishes and take one task at a time, so a slow
+    # Gemini call never holds a backlog of prefetched analyses hostage
+    celery_app.conf.update(task_acks_late=True, worker_prefetch_multiplier=1)
+    analyze_outfit_task = celery_app.task(name="analyze_outfit_image")(analyze_outfit_image)
+    logger.info("Outfit analysis will be dispatched to Celery")
+
+
+def dispatch_analysis(background_tasks: BackgroundTasks, image_url: str, outfit_id: str) -> None:
+    """Queue analysis for an outfit, preferring the Celery worker pool."""
+    if analyze_outfit_task is not None:
+        try:
+            analyze_outfit_task.delay(image_url, outfit_id)
+            return
+        except Exception:
+            logger.exception("Failed to enqueue analysis for outfit %s, running in-process", outfit_id)
+
+    background_tasks.add_task(analyze_outfit_image, image_url, outfit_id)